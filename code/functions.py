@@ -214,6 +214,24 @@ def dist_vector(v1_list, v2_list):
     dist_list = haversine_vector(v1_list, v2_list, unit="m") # [(lat,lon)], [(lat,lon)]
     return dist_list
 
+def dist_matrix(lats, lons):
+    """Matrix of the haversine distances in m between all pairs of the points given by the arrays lats, lons
+    """
+    points = np.column_stack((np.asarray(lats, dtype = np.float64), np.asarray(lons, dtype = np.float64)))
+    n = len(points)
+    return dist_vector(np.repeat(points, n, axis = 0), np.tile(points, (n, 1))).reshape(n, n)
+
+def reciprocals(a):
+    """1/a elementwise, with 0 where a is 0 (and where a is inf)
+    """
+    a = np.asarray(a, dtype = np.float64)
+    return np.divide(1, a, out = np.zeros(a.shape), where = a != 0)
+
+def reciprocal_sum(a):
+    """Sum of 1/a over the non-zero elements of a
+    """
+    return float(reciprocals(a).sum())
+
 def osm_to_ig(node, edge):
     """ Turns a node and edge dataframe into an igraph Graph.
     """
@@ -293,6 +311,31 @@ def check_extract_zip(p, prefix):
         return False
 
 
+def network_files(p, placeid, parameterid):
+    """Return the paths of the node and edge files of a network,
+    preferring the zip files if available.
+    """
+    prefix = placeid + '_' + parameterid
+    files = []
+    for part in ['_nodes', '_edges']:
+        if os.path.isfile(p + prefix + part + '.zip'):
+            files.append(p + prefix + part + '.zip')
+        else:
+            files.append(p + prefix + part + '.csv')
+    return files
+
+
+def hash_files(filepaths):
+    """Return a sha1 hex digest over the contents of all files in filepaths.
+    """
+    h = hashlib.sha1()
+    for filepath in filepaths:
+        with open(filepath, 'rb') as f:
+            for chunk in iter(lambda: f.read(1 << 20), b''):
+                h.update(chunk)
+    return h.hexdigest()
+
+
 def csv_to_ox(p, placeid, parameterid):
     """ Load a networkx graph from _edges.csv and _nodes.csv
     The edge file must have attributes u,v,osmid,length
@@ -350,13 +393,49 @@ def csv_to_ig(p, placeid, parameterid, cleanup = True):
         os.remove(p + prefix + '_nodes.csv')
         os.remove(p + prefix + '_edges.csv')
     if empty:
-        return ig.Graph(directed = False)
+        G = ig.Graph(directed = False)
+        build_idindex(G)
+        return G
     G = osm_to_ig(n, e)
     round_coordinates(G)
     mirror_y(G)
+    build_idindex(G)
     return G
 
 
+def build_idindex(G):
+    """Attach to G a dict G.idindex from node id to vertex index, for fast lookups 
+    instead of G.vs.find(id = ...), which scans all nodes. Returns the dict.
+    Call this again after changing the nodes of G.
+    """
+    G.idindex = dict(zip(G.vs["id"], range(G.vcount()))) if "id" in G.vs.attributes() else {}
+    return G.idindex
+
+
+def get_idindex(G):
+    """Return the dict from node id to vertex index of G, building it
+    if G has none yet (e.g. a subgraph) or if its number of nodes has changed.
+    """
+    idindex = getattr(G, "idindex", None)
+    if idindex is None or len(idindex) != G.vcount():
+        idindex = build_idindex(G)
+    return idindex
+
+
+def get_poi_coordinates(G, nnids):
+    """Return the x and y coordinates of the distinct nodes of G given by nnids as numpy arrays,
+    resolving them only once and caching them on G as G.poi_coordinates, like get_idindex.
+    """
+    key = (G.vcount(), tuple(nnids))
+    cached = getattr(G, "poi_coordinates", None)
+    if cached is None or cached[0] != key:
+        idindex = get_idindex(G)
+        indices = list(set(idindex[poi] for poi in nnids))
+        cached = (key, np.array(G.vs[indices]["x"], dtype = float), np.array(G.vs[indices]["y"], dtype = float))
+        G.poi_coordinates = cached
+    return cached[1:]
+
+
 def ig_to_geojson(G):
     linestring_list = []
     for e in G.es():
@@ -394,61 +473,180 @@ def segments_intersect(A,B,C,D):
     if (A.x == C.x and A.y == C.y) or (A.x == D.x and A.y == D.y) or (B.x == C.x and B.y == C.y) or (B.x == D.x and B.y == D.y): return False # If the segments share an endpoint they do not intersect properly
     return ccw(A,C,D) != ccw(B,C,D) and ccw(A,B,C) != ccw(A,B,D)
 
-def new_edge_intersects(G, enew):
+class SegmentGrid:
+    """Uniform grid spatial index of line segments, keyed on their bounding boxes.
+    Segments can only intersect if their bounding boxes overlap, and overlapping
+    bounding boxes always share at least one grid cell. Therefore only segments
+    in the cells covered by a query segment need to be checked.
+    """
+    def __init__(self, cellsize):
+        self.cellsize = cellsize
+        self.cells = defaultdict(list)
+        self.segments = []
+
+    def cellrange(self, s):
+        """Cells (i, j) covered by the bounding box of segment s = (x1, y1, x2, y2)
+        """
+        i1, i2 = sorted((math.floor(s[0] / self.cellsize), math.floor(s[2] / self.cellsize)))
+        j1, j2 = sorted((math.floor(s[1] / self.cellsize), math.floor(s[3] / self.cellsize)))
+        return itertools.product(range(i1, i2+1), range(j1, j2+1))
+
+    def add(self, s):
+        self.segments.append(s)
+        for cell in self.cellrange(s):
+            self.cells[cell].append(len(self.segments)-1)
+
+    def nearby(self, s):
+        """Return all segments whose bounding boxes may overlap with the one of s
+        """
+        found = set()
+        for cell in self.cellrange(s):
+            found.update(self.cells.get(cell, []))
+        return [self.segments[i] for i in found]
+
+
+def segmentgrid_for(G):
+    """Create an empty SegmentGrid for a graph G of points (e.g. POIs),
+    with a cell size that matches the average spacing of the points.
+    """
+    xs = G.vs["x"] if G.vcount() else [0]
+    ys = G.vs["y"] if G.vcount() else [0]
+    area = (max(xs) - min(xs)) * (max(ys) - min(ys))
+    cellsize = math.sqrt(area / max(G.vcount(), 1))
+    if cellsize <= 0: # degenerate case: all points on a line or identical
+        cellsize = max(max(xs) - min(xs), max(ys) - min(ys), 1)
+    return SegmentGrid(cellsize)
+
+
+def in_general_position(xs, ys, tol = 1e-9):
+    """Check that no two points coincide and no three points are collinear,
+    up to an angle tolerance tol (in radians) to be safe from rounding errors.
+    """
+    pts = np.column_stack((xs, ys)).astype(np.float64)
+    for i in range(len(pts)-1):
+        d = pts[i+1:] - pts[i]
+        if np.any((d[:, 0] == 0) & (d[:, 1] == 0)): return False
+        # Points j, k are collinear with i if they have the same direction from i, modulo pi
+        angles = np.sort(np.arctan2(d[:, 1], d[:, 0]) % np.pi)
+        if len(angles) > 1 and (np.any(np.diff(angles) <= tol) or angles[0] + np.pi - angles[-1] <= tol):
+            return False
+    return True
+
+
+def convex_hull_size(xs, ys):
+    """Number of points on the convex hull, with Andrew's monotone chain algorithm.
+    """
+    pts = sorted(set(zip(xs, ys)))
+    if len(pts) < 3: return len(pts)
+    def halfhull(points):
+        h = []
+        for p in points:
+            while len(h) >= 2 and (h[-1][0]-h[-2][0])*(p[1]-h[-2][1]) - (h[-1][1]-h[-2][1])*(p[0]-h[-2][0]) <= 0:
+                h.pop()
+            h.append(p)
+        return h
+    return len(halfhull(pts)) + len(halfhull(reversed(pts))) - 2
+
+
+def max_triangulation_edges(G):
+    """Maximal number of edges of a planar straight-line graph on the nodes of G,
+    which is reached exactly by any triangulation: 3n-3-h, with h nodes on the convex hull.
+    Returns None if the nodes are not in general position, as then a graph 
+    with overlapping collinear edges could have more edges.
+    """
+    n = G.vcount()
+    if n < 3: return n*(n-1)//2
+    if not in_general_position(G.vs["x"], G.vs["y"]): return None
+    return 3*n - 3 - convex_hull_size(G.vs["x"], G.vs["y"])
+
+
+def new_edge_intersects(G, enew, segmentgrid = None):
     """Given a graph G and a potential new edge enew,
     check if enew will intersect any old edge.
+    If segmentgrid (a SegmentGrid holding all edges of G) is given,
+    only nearby edges are checked, with the same result.
     """
     E1 = MyPoint(enew[0], enew[1])
     E2 = MyPoint(enew[2], enew[3])
+    if segmentgrid is not None:
+        for s in segmentgrid.nearby(enew):
+            if segments_intersect(E1, E2, MyPoint(s[0], s[1]), MyPoint(s[2], s[3])):
+                return True
+        return False
     for e in G.es():
         O1 = MyPoint(e.source_vertex["x"], e.source_vertex["y"])
         O2 = MyPoint(e.target_vertex["x"], e.target_vertex["y"])
         if segments_intersect(E1, E2, O1, O2):
             return True
     return False
-    
+
+
+def node_ids(G):
+    """Return the node ids of G as ndarray (empty if G has no ids).
+    """
+    return np.array(G.vs["id"] if "id" in G.vs.attributes() else [], dtype = np.int64)
+
+
+def overlapping_edges(G1, G2):
+    """Returns a boolean array over the edges of G1 that is True where the two
+    end nodes of the edge (by node id) are also connected in G2.
+    Edges are compared as sorted arrays of canonical (min, max) keys of the node id ranks.
+    """
+    ids1, ids2 = node_ids(G1), node_ids(G2)
+    if G1.ecount() == 0 or G2.ecount() == 0 or len(ids1) < G1.vcount() or len(ids2) < G2.vcount():
+        return np.zeros(G1.ecount(), dtype = bool)
+    allids = np.unique(np.concatenate((ids1, ids2)))
+    keys = []
+    for ids, G in [(ids1, G1), (ids2, G2)]:
+        ranks = np.searchsorted(allids, ids)
+        edges = ranks[np.array(G.get_edgelist(), dtype = np.int64)]
+        keys.append(np.minimum(edges[:, 0], edges[:, 1]) * len(allids) + np.maximum(edges[:, 0], edges[:, 1]))
+    return np.isin(keys[0], keys[1])
+
 
 def delete_overlaps(G_res, G_orig, verbose = False):
     """Deletes inplace all overlaps of G_res with G_orig (from G_res)
     based on node ids. In other words: G_res -= G_orig
     """
-    del_edges = []
-    for e in list(G_res.es):
-        try:
-            n1_id = e.source_vertex["id"]
-            n2_id = e.target_vertex["id"]
-            # If there is already an edge in the original network, delete it
-            n1_index = G_orig.vs.find(id = n1_id).index
-            n2_index = G_orig.vs.find(id = n2_id).index
-            if G_orig.are_connected(n1_index, n2_index):
-                del_edges.append(e.index)
-        except:
-            pass
+    # If there is already an edge in the original network, delete it
+    del_edges = np.flatnonzero(overlapping_edges(G_res, G_orig)).tolist()
     G_res.delete_edges(del_edges)
     # Remove isolated nodes
     isolated_nodes = G_res.vs.select(_degree_eq=0)
     G_res.delete_vertices(isolated_nodes)
+    build_idindex(G_res)
     if verbose: print("Removed " + str(len(del_edges)) + " overlapping edges and " + str(len(isolated_nodes)) + " nodes.")
 
 def constrict_overlaps(G_res, G_orig, factor = 5):
     """Increases length by factor of all overlaps of G_res with G_orig (in G_res) based on edge ids.
     """
-    for e in list(G_res.es):
-        try:
-            n1_id = e.source_vertex["id"]
-            n2_id = e.target_vertex["id"]
-            n1_index = G_orig.vs.find(id = n1_id).index
-            n2_index = G_orig.vs.find(id = n2_id).index
-            if G_orig.are_connected(n1_index, n2_index):
-                G_res.es[e.index]["weight"] = factor * G_res.es[e.index]["weight"]
-        except:
-            pass
+    overlap = overlapping_edges(G_res, G_orig)
+    if overlap.any():
+        weights = G_res.es["weight"]
+        G_res.es["weight"] = [factor * w if o else w for w, o in zip(weights, overlap.tolist())]
 
 
 
     
 
-def greedy_triangulation_routing_clusters(G, G_total, clusters, clusterinfo, prune_quantiles = [1], prune_measure = "betweenness", verbose = False, full_run = False):
+def abstract_graph(G, indices):
+    """Creates a graph without edges on the nodes of G with the given vertex indices,
+    with the same node attributes and edge attribute names as G. Node order is by index.
+    This is the same as G.subgraph(indices) after deleting all edges of G, without copying G.
+    """
+    indices = sorted(set(indices))
+    G_abstract = ig.Graph(n = len(indices), directed = G.is_directed())
+    for attribute_name in G.attributes():
+        G_abstract[attribute_name] = G[attribute_name]
+    vs = G.vs.select(indices)
+    for attribute_name in G.vs.attributes():
+        G_abstract.vs[attribute_name] = vs[attribute_name]
+    for attribute_name in G.es.attributes():
+        G_abstract.es[attribute_name] = []
+    return G_abstract
+
+
+def greedy_triangulation_routing_clusters(G, G_total, clusters, clusterinfo, prune_quantiles = [1], prune_measure = "betweenness", verbose = False, full_run = False, processes = 1):
     """Greedy Triangulation (GT) of a bike network G's clusters,
     then routing on the graph G_total that includes car infra to connect the GT.
     G and G_total are ipgraph graphs
@@ -459,26 +657,28 @@ def greedy_triangulation_routing_clusters(G, G_total, clusters, clusterinfo, pru
     See: cardillo2006spp
     
     Distance here is routing distance, while edge crossing is checked on an abstract 
-    level.
+    level. The distances between clusters are routed on processes processes.
     """
     
     if len(clusters) < 2: return ([], []) # We can't do anything with less than 2 clusters
 
     centroid_indices = [v["centroid_index"] for k, v in sorted(clusterinfo.items(), key=lambda item: item[1]["size"], reverse = True)]
-    G_temp = copy.deepcopy(G_total)
-    for e in G_temp.es: # delete all edges
-        G_temp.es.delete(e)
     
-    clusterpairs = clusterpairs_by_distance(G, G_total, clusters, clusterinfo, True, verbose, full_run)
+    clusterpairs = clusterpairs_by_distance(G, G_total, clusters, clusterinfo, True, verbose, full_run, processes)
     if len(clusterpairs) == 0: return ([], [])
     
     centroidpairs = [((clusterinfo[c[0][0]]['centroid_id'], clusterinfo[c[0][1]]['centroid_id']), c[2]) for c in clusterpairs]
     
+    # Run the whole GT and calculate its prune measure only once, then prune it for every quantile
+    GT_full = abstract_graph(G_total, centroid_indices)
+    greedy_triangulation_edges(GT_full, centroidpairs)
+    set_prune_measure(GT_full, prune_measure)
+
     GT_abstracts = []
     GTs = []
+    pathcache = {} # routed paths, shared by all quantiles
     for prune_quantile in prune_quantiles:
-        GT_abstract = copy.deepcopy(G_temp.subgraph(centroid_indices))
-        GT_abstract = greedy_triangulation(GT_abstract, centroidpairs, prune_quantile, prune_measure)
+        GT_abstract = prune_triangulation(GT_full, prune_quantile, prune_measure)
         GT_abstracts.append(GT_abstract)
 
         centroidids_closestnodeids = {} # dict for retrieveing quickly closest node ids pairs from centroidid pairs
@@ -495,11 +695,7 @@ def greedy_triangulation_routing_clusters(G, G_total, clusters, clusterinfo, pru
         routenodepairs.sort(key=lambda x: x[1])
 
         # Do the routing, on G_total
-        GT_indices = set()
-        for poipair, poipair_distance in routenodepairs:
-            poipair_ind = (G_total.vs.find(id = poipair[0]).index, G_total.vs.find(id = poipair[1]).index)
-            sp = set(G_total.get_shortest_paths(poipair_ind[0], poipair_ind[1], weights = "weight", output = "vpath")[0])
-            GT_indices = GT_indices.union(sp)
+        GT_indices = routed_indices(G_total, [poipair for poipair, poipair_distance in routenodepairs], pathcache)
 
         GT = G_total.induced_subgraph(GT_indices)
         GTs.append(GT)
@@ -507,80 +703,61 @@ def greedy_triangulation_routing_clusters(G, G_total, clusters, clusterinfo, pru
     return(GTs, GT_abstracts)
 
 
-def clusterpairs_by_distance(G, G_total, clusters, clusterinfo, return_distances = False, verbose = False, full_run = False):
+def clusterpairs_by_distance(G, G_total, clusters, clusterinfo, return_distances = False, verbose = False, full_run = False, processes = 1):
     """Calculates the (weighted) graph distances on G for a number of clusters.
     Returns all pairs of cluster ids and closest nodes in ascending order of their distance. 
     If return_distances, then distances are also returned.
 
     Returns a list containing these elements, sorted by distance:
     [(clusterid1, clusterid2), (closestnodeid1, closestnodeid2), distance]
+
+    The closest node pairs are exact: For each cluster, one multi-source shortest path
+    sweep from all its nodes reaches all other clusters at once (see multisource_distances).
+    full_run is kept for compatibility; the result is always that of a full run.
+    With processes > 1, the sweeps of all clusters are spread over a SharedCSRPool.
     """
     
     cluster_indices = clusterindices_by_length(clusterinfo, False) # Start with the smallest so the for loop is as short as possible
     clusterpairs = []
-    clustercopies = {}
+    members = cluster_members(G_total, clusters, cluster_indices)
+    if processes > 1:
+        # Sweep from all clusters at once, to the nodes of all clusters
+        targets = np.concatenate([members[c] for c in cluster_indices])
+        offsets = dict(zip(cluster_indices, np.cumsum([0] + [len(members[c]) for c in cluster_indices[:-1]]).tolist()))
+        c1s = [c1 for c1 in cluster_indices[:-1] if len(members[c1])]
+        with SharedCSRPool(CSRGraph.from_ig(G_total), processes) as pool:
+            sweeps = dict(zip(c1s, pool.nearest_sources([members[c1] for c1 in c1s], targets)))
+    else:
+        G_super = supersource_graph(G_total)
     
-    # Create copies of all clusters
-    for i in range(len(cluster_indices)):
-        clustercopies[i] = clusters[i].copy()
-        
     # Take one cluster
     for i, c1 in enumerate(cluster_indices[:-1]):
-        c1_indices = G_total.vs.select(lambda x: x["id"] in clustercopies[c1].vs()["id"]).indices
         print("Working on cluster " + str(i+1) + " of " + str(len(cluster_indices)) + "...")
-        for j, c2 in enumerate(cluster_indices[i+1:]):
-            closest_pair = {'i': -1, 'j': -1}
-            min_dist = np.inf
-            c2_indices = G_total.vs.select(lambda x: x["id"] in clustercopies[c2].vs()["id"]).indices
-            if verbose: print("... routing " + str(len(c1_indices)) + " nodes to " + str(len(c2_indices)) + " nodes in other cluster " + str(j+1) + " of " + str(len(cluster_indices[i+1:])) + ".")
-            
-            if full_run:
-                # Compare all pairs of nodes in both clusters (takes long)
-                for a in list(c1_indices):
-                    sp = G_total.get_shortest_paths(a, c2_indices, weights = "weight", output = "epath")
-
-                    if all([not elem for elem in sp]):
-                        # If there is no path from one node, there is no path from any node
-                        break
-                    else:
-                        for path, c2_index in zip(sp, c2_indices):
-                            if len(path) >= 1:
-                                dist_nodes = sum([G_total.es[e]['weight'] for e in path])
-                                if dist_nodes < min_dist:
-                                    closest_pair['i'] = G_total.vs[a]["id"]
-                                    closest_pair['j'] = G_total.vs[c2_index]["id"]
-                                    min_dist = dist_nodes
-            else:
-                # Do a heuristic that should be close enough.
-                # From cluster 1, look at all shortest paths only from its centroid
-                a = clusterinfo[c1]["centroid_index"]
-                sp = G_total.get_shortest_paths(a, c2_indices, weights = "weight", output = "epath")
-                if all([not elem for elem in sp]):
-                    # If there is no path from one node, there is no path from any node
-                    break
-                else:
-                    for path, c2_index in zip(sp, c2_indices):
-                        if len(path) >= 1:
-                            dist_nodes = sum([G_total.es[e]['weight'] for e in path])
-                            if dist_nodes < min_dist:
-                                closest_pair['j'] = G_total.vs[c2_index]["id"]
-                                min_dist = dist_nodes
-                # Closest c2 node to centroid1 found. Now find all c1 nodes to that closest c2 node.
-                b = G_total.vs.find(id = closest_pair['j']).index
-                sp = G_total.get_shortest_paths(b, c1_indices, weights = "weight", output = "epath")
-                if all([not elem for elem in sp]):
-                    # If there is no path from one node, there is no path from any node
-                    break
-                else:
-                    for path, c1_index in zip(sp, c1_indices):
-                        if len(path) >= 1:
-                            dist_nodes = sum([G_total.es[e]['weight'] for e in path])
-                            if dist_nodes <= min_dist: # <=, not <!
-                                closest_pair['i'] = G_total.vs[c1_index]["id"]
-                                min_dist = dist_nodes
-            
-            if closest_pair['i'] != -1 and closest_pair['j'] != -1:
-                clusterpairs.append([(c1, c2), (closest_pair['i'], closest_pair['j']), min_dist])
+        if not len(members[c1]): continue
+        c2s = [c2 for c2 in cluster_indices[i+1:] if len(members[c2])]
+        if verbose: print("... routing " + str(len(members[c1])) + " nodes to the nodes of " + str(len(c2s)) + " other clusters.")
+        
+        if processes > 1:
+            dist, nearest = sweeps[c1]
+            for c2 in c2s:
+                c2_dist = dist[offsets[c2]:offsets[c2]+len(members[c2])]
+                if np.isfinite(c2_dist).any():
+                    k = offsets[c2] + np.argmin(c2_dist)
+                    clusterpairs.append([(c1, c2), (G_total.vs[int(nearest[k])]["id"], G_total.vs[int(targets[k])]["id"]), c2_dist.min()])
+            continue
+        
+        # Closest node of each other cluster, and its distance to the closest node of c1
+        dist = multisource_distances(G_super, members[c1])
+        closest = []
+        for c2 in c2s:
+            c2_dist = dist[members[c2]]
+            if np.isfinite(c2_dist).any():
+                closest.append((c2, members[c2][np.argmin(c2_dist)], c2_dist.min()))
+        
+        # The closest node of c1 is the last c1 node on the shortest path to the closest c2 node
+        sources = multisource_nearest_sources(G_super, members[c1], [c[1] for c in closest])
+        for (c2, c2_index, min_dist), c1_index in zip(closest, sources):
+            clusterpairs.append([(c1, c2), (G_total.vs[c1_index]["id"], G_total.vs[c2_index]["id"]), min_dist])
                                     
     clusterpairs.sort(key = lambda x: x[-1])
     if return_distances:
@@ -589,7 +766,59 @@ def clusterpairs_by_distance(G, G_total, clusters, clusterinfo, return_distances
         return [[o[0], o[1]] for o in clusterpairs]
 
 
-def mst_routing(G, pois):
+def cluster_members(G_total, clusters, cluster_indices):
+    """Returns a dict from cluster id to the ndarray of vertex indices in G_total of all nodes of the cluster.
+    """
+    idindex = get_idindex(G_total)
+    members = {}
+    for c in cluster_indices:
+        members[c] = np.array(sorted(idindex[nid] for nid in clusters[c].vs["id"] if nid in idindex), dtype = np.int64)
+    return members
+
+
+def supersource_graph(G):
+    """Returns a copy of G with one additional node, the super-source, as the last node.
+    It is connected with zero weight to the source nodes of multisource_distances.
+    """
+    G_super = G.copy()
+    G_super.add_vertex()
+    return G_super
+
+
+def connect_supersource(G_super, sources):
+    """Connects the super-source of G_super (the last node) to the source node indices only.
+    """
+    s = G_super.vcount() - 1
+    G_super.delete_edges(G_super.incident(s))
+    G_super.add_edges([(s, source) for source in sources])
+    G_super.es[G_super.ecount()-len(sources):]["weight"] = [0.0] * len(sources)
+    return s
+
+
+def multisource_distances(G_super, sources):
+    """Distances on G_super (from supersource_graph) from the nearest of several source node 
+    indices to all original nodes, with one Dijkstra sweep from the super-source.
+    """
+    s = connect_supersource(G_super, sources)
+    return np.array(G_super.distances(s, weights = "weight")[0][:-1], dtype = np.float64)
+
+
+def multisource_nearest_sources(G_super, sources, targets):
+    """For each target node index, returns the source node index nearest to it, with
+    one Dijkstra sweep from the super-source of G_super (from supersource_graph).
+    Targets must be reachable.
+    """
+    if not len(targets): return []
+    s = connect_supersource(G_super, sources)
+    sources = set(sources)
+    nearest = []
+    for path in G_super.get_shortest_paths(s, targets, weights = "weight", output = "vpath"):
+        # Any later source node on the path is at least as close to the target
+        nearest.append([v for v in path if v in sources][-1])
+    return nearest
+
+
+def mst_routing(G, pois, poidistances = None, router = None, candidates = "all", pathcache = None):
     """Minimum Spanning Tree (MST) of a graph G's node subset pois,
     then routing to connect the MST.
     G is an ipgraph graph, pois is a list of node ids.
@@ -599,25 +828,35 @@ def mst_routing(G, pois):
 
     Distance here is routing distance, while edge crossing is checked on an abstract 
     level.
+    If poidistances (poi ids and distance matrix, as from load_poi_distances) are given,
+    they are used instead of routing all pairs of pois again.
+    If router (for example a CSRGraph of G, see load_router) is given,
+    it is used instead of G for the routing.
+    With candidates "delaunay" or "knn", only the candidate pairs from candidate_poipairs
+    are routed and considered.
+    If a dict pathcache is given, paths found there are reused and new ones added (see routed_indices).
     """
 
     if len(pois) < 2: return (ig.Graph(), ig.Graph()) # We can't do anything with less than 2 POIs
 
     # MST_abstract is the MST with same nodes but euclidian links
+    idindex = get_idindex(G)
     pois_indices = set()
     for poi in pois:
-        pois_indices.add(G.vs.find(id = poi).index)
-    G_temp = copy.deepcopy(G)
-    for e in G_temp.es: # delete all edges
-        G_temp.es.delete(e)
+        pois_indices.add(idindex[poi])
         
-    poipairs = poipairs_by_distance(G, pois, True)
+    if candidates != "all":
+        poipairs = candidate_poipairs_by_distance(G, pois, candidates, poidistances, router)
+    elif poidistances is None:
+        poipairs = poipairs_by_distance(G, pois, True, router)
+    else:
+        poipairs = poipairs_from_distances(*poidistances, True)
     if len(poipairs) == 0: return (ig.Graph(), ig.Graph())
 
-    MST_abstract = copy.deepcopy(G_temp.subgraph(pois_indices))
-    for poipair, poipair_distance in poipairs:
-        poipair_ind = (MST_abstract.vs.find(id = poipair[0]).index, MST_abstract.vs.find(id = poipair[1]).index)
-        MST_abstract.add_edge(poipair_ind[0], poipair_ind[1] , weight = poipair_distance)
+    MST_abstract = abstract_graph(G, pois_indices)
+    abstract_ind = {poi: i for i, poi in enumerate(MST_abstract.vs["id"])}
+    MST_abstract.add_edges([(abstract_ind[poipair[0]], abstract_ind[poipair[1]]) for poipair, poipair_distance in poipairs])
+    MST_abstract.es["weight"] = [poipair_distance for poipair, poipair_distance in poipairs]
     MST_abstract = MST_abstract.spanning_tree(weights = "weight")
 
     # Get node pairs we need to route, sorted by distance
@@ -627,11 +866,7 @@ def mst_routing(G, pois):
     routenodepairs = sorted(routenodepairs.items(), key = lambda x: x[1])
 
     # Do the routing
-    MST_indices = set()
-    for poipair, poipair_distance in routenodepairs:
-        poipair_ind = (G.vs.find(id = poipair[0]).index, G.vs.find(id = poipair[1]).index)
-        sp = set(G.get_shortest_paths(poipair_ind[0], poipair_ind[1], weights = "weight", output = "vpath")[0])
-        MST_indices = MST_indices.union(sp)
+    MST_indices = routed_indices(G, [poipair for poipair, poipair_distance in routenodepairs], {} if pathcache is None else pathcache, router)
 
     MST = G.induced_subgraph(MST_indices)
     
@@ -649,40 +884,67 @@ def greedy_triangulation(GT, poipairs, prune_quantile = 1, prune_measure = "betw
     See: cardillo2006spp
     """
     
+    greedy_triangulation_edges(GT, poipairs)
+    set_prune_measure(GT, prune_measure)
+    return prune_triangulation(GT, prune_quantile, prune_measure, edgeorder)
+
+
+def greedy_triangulation_edges(GT, poipairs):
+    """Adds inplace all edges of the full (unpruned) GT to a graph GT with an empty edge set.
+    poipairs can be any iterable in ascending order of distance, for example from poipairs_stream.
+    The iteration stops early once the GT is a full triangulation, because then
+    no further edge can be added without a crossing.
+    If GT already has edges (the GT of all shorter pairs), the GT is continued from them.
+    """
+    maxedges = max_triangulation_edges(GT)
+    idindex = get_idindex(GT)
+    connected = set()
+    segmentgrid = segmentgrid_for(GT)
+    for e in GT.es:
+        segmentgrid.add((GT.vs[e.source]["x"], GT.vs[e.source]["y"], GT.vs[e.target]["x"], GT.vs[e.target]["y"]))
+        connected.add((min(e.tuple), max(e.tuple)))
     for poipair, poipair_distance in poipairs:
-        poipair_ind = (GT.vs.find(id = poipair[0]).index, GT.vs.find(id = poipair[1]).index)
-        if not new_edge_intersects(GT, (GT.vs[poipair_ind[0]]["x"], GT.vs[poipair_ind[0]]["y"], GT.vs[poipair_ind[1]]["x"], GT.vs[poipair_ind[1]]["y"])):
+        if maxedges is not None and len(connected) >= maxedges: break
+        poipair_ind = (idindex[poipair[0]], idindex[poipair[1]])
+        enew = (GT.vs[poipair_ind[0]]["x"], GT.vs[poipair_ind[0]]["y"], GT.vs[poipair_ind[1]]["x"], GT.vs[poipair_ind[1]]["y"])
+        if not new_edge_intersects(GT, enew, segmentgrid):
             GT.add_edge(poipair_ind[0], poipair_ind[1], weight = poipair_distance)
-            
-    # Get the measure for pruning
+            segmentgrid.add(enew)
+            connected.add((min(poipair_ind), max(poipair_ind)))
+
+
+def set_prune_measure(GT, prune_measure = "betweenness"):
+    """Calculates the measure for pruning on the full GT and stores it inplace,
+    as edge attributes (bw, width) for betweenness or as node attribute (cc) for closeness.
+    """
     if prune_measure == "betweenness":
         BW = GT.edge_betweenness(directed = False, weights = "weight")
+        GT.es["bw"] = BW
+        GT.es["width"] = [math.sqrt(bw+1)*0.5 for bw in BW]
+    elif prune_measure == "closeness":
+        GT.vs["cc"] = GT.closeness(vertices = None, weights = "weight")
+
+
+def prune_triangulation(GT, prune_quantile = 1, prune_measure = "betweenness", edgeorder = False):
+    """Prunes a full GT, whose measure was set with set_prune_measure, to prune_quantile.
+    For the random prune_measure, edgeorder gives the order in which edges are kept.
+    Returns a new graph, GT itself is not changed.
+    """
+    if prune_measure == "betweenness":
+        BW = GT.es["bw"]
         qt = np.quantile(BW, 1-prune_quantile)
-        sub_edges = []
-        for c, e in enumerate(GT.es):
-            if BW[c] >= qt: 
-                sub_edges.append(c)
-            GT.es[c]["bw"] = BW[c]
-            GT.es[c]["width"] = math.sqrt(BW[c]+1)*0.5
-        # Prune
-        GT = GT.subgraph_edges(sub_edges)
+        return GT.subgraph_edges([c for c, bw in enumerate(BW) if bw >= qt])
     elif prune_measure == "closeness":
-        CC = GT.closeness(vertices = None, weights = "weight")
+        CC = GT.vs["cc"]
         qt = np.quantile(CC, 1-prune_quantile)
-        sub_nodes = []
-        for c, v in enumerate(GT.vs):
-            if CC[c] >= qt: 
-                sub_nodes.append(c)
-            GT.vs[c]["cc"] = CC[c]
-        GT = GT.induced_subgraph(sub_nodes)
+        return GT.induced_subgraph([c for c, cc in enumerate(CC) if cc >= qt])
     elif prune_measure == "random":
         ind = np.quantile(np.arange(len(edgeorder)), prune_quantile, interpolation = "lower") + 1 # "lower" and + 1 so smallest quantile has at least one edge
-        GT = GT.subgraph_edges(edgeorder[:ind])
-    
-    return GT
+        return GT.subgraph_edges(edgeorder[:ind])
+    return GT.copy()
 
 
-def greedy_triangulation_routing(G, pois, prune_quantiles = [1], prune_measure = "betweenness"):
+def greedy_triangulation_routing(G, pois, prune_quantiles = [1], prune_measure = "betweenness", poidistances = None, router = None, candidates = "all", pathcache = None):
     """Greedy Triangulation (GT) of a graph G's node subset pois,
     then routing to connect the GT (up to a quantile of betweenness
     betweenness_quantile).
@@ -695,92 +957,200 @@ def greedy_triangulation_routing(G, pois, prune_quantiles = [1], prune_measure =
     
     Distance here is routing distance, while edge crossing is checked on an abstract 
     level.
+    If poidistances (poi ids and distance matrix, as from load_poi_distances) are given,
+    they are used instead of routing all pairs of pois again.
+    If router (for example a CSRGraph of G, see load_router) is given,
+    it is used instead of G for the routing.
+    With candidates "delaunay" or "knn", only the candidate pairs from candidate_poipairs
+    are routed and considered. This is faster but can differ from the exact GT, see fast_gt_report.
+    If a dict pathcache is given, the routed paths are added to it (see routed_indices).
     """
     
-    if len(pois) < 2: return ([], []) # We can't do anything with less than 2 POIs
+    GT_abstracts = []
+    GTs = []
+    for prune_quantile, GT, GT_abstract in greedy_triangulation_growth(G, pois, prune_quantiles, prune_measure, poidistances, router, candidates, pathcache):
+        GT_abstracts.append(GT_abstract)
+        GTs.append(GT)
+    
+    return (GTs, GT_abstracts)
 
-    # GT_abstract is the GT with same nodes but euclidian links to keep track of edge crossings
-    pois_indices = set()
-    for poi in pois:
-        pois_indices.add(G.vs.find(id = poi).index)
-    G_temp = copy.deepcopy(G)
-    for e in G_temp.es: # delete all edges
-        G_temp.es.delete(e)
-        
-    poipairs = poipairs_by_distance(G, pois, True)
-    if len(poipairs) == 0: return ([], [])
 
+def greedy_triangulation_growth(G, pois, prune_quantiles = [1], prune_measure = "betweenness", poidistances = None, router = None, candidates = "all", pathcache = None):
+    """Greedy Triangulation of a graph G's node subset pois, as greedy_triangulation_routing,
+    but yields the growth stages (prune_quantile, GT, GT_abstract) one at a time instead of 
+    returning lists of all of them. Only the full abstract GT is kept in memory, so a consumer 
+    can write, measure or plot every stage before the next one is generated.
+    """
+    
+    GT_full = greedy_triangulation_full(G, pois, prune_measure, poidistances, router, candidates)
+    if GT_full is None: return
     if prune_measure == "random":
-        # run the whole GT first
-        GT = copy.deepcopy(G_temp.subgraph(pois_indices))
-        for poipair, poipair_distance in poipairs:
-            poipair_ind = (GT.vs.find(id = poipair[0]).index, GT.vs.find(id = poipair[1]).index)
-            if not new_edge_intersects(GT, (GT.vs[poipair_ind[0]]["x"], GT.vs[poipair_ind[0]]["y"], GT.vs[poipair_ind[1]]["x"], GT.vs[poipair_ind[1]]["y"])):
-                GT.add_edge(poipair_ind[0], poipair_ind[1], weight = poipair_distance)
-        # create a random order for the edges
-        random.seed(0) # const seed for reproducibility
-        edgeorder = random.sample(range(GT.ecount()), k = GT.ecount())
+        edgeorder = random_edgeorder(GT_full, 0) # const seed for reproducibility
     else: 
         edgeorder = False
     
-    GT_abstracts = []
-    GTs = []
+    if pathcache is None: pathcache = {} # routed paths, shared by all quantiles
     for prune_quantile in tqdm(prune_quantiles, desc = "Greedy triangulation", leave = False):
-        GT_abstract = copy.deepcopy(G_temp.subgraph(pois_indices))
-        GT_abstract = greedy_triangulation(GT_abstract, poipairs, prune_quantile, prune_measure, edgeorder)
-        GT_abstracts.append(GT_abstract)
+        GT_abstract = prune_triangulation(GT_full, prune_quantile, prune_measure, edgeorder)
+        yield (prune_quantile, route_triangulation(G, GT_abstract, pathcache, router), GT_abstract)
+    
+    
+def greedy_triangulation_full(G, pois, prune_measure = "betweenness", poidistances = None, router = None, candidates = "all"):
+    """Full, unpruned abstract Greedy Triangulation of a graph G's node subset pois,
+    with the prune measure set on its edges, see greedy_triangulation_routing.
+    Returns None if there is nothing to triangulate.
+    """
+
+    if len(pois) < 2: return None # We can't do anything with less than 2 POIs
+
+    # GT_abstract is the GT with same nodes but euclidian links to keep track of edge crossings
+    idindex = get_idindex(G)
+    pois_indices = set()
+    for poi in pois:
+        pois_indices.add(idindex[poi])
         
-        # Get node pairs we need to route, sorted by distance
-        routenodepairs = {}
-        for e in GT_abstract.es:
-            routenodepairs[(e.source_vertex["id"], e.target_vertex["id"])] = e["weight"]
-        routenodepairs = sorted(routenodepairs.items(), key = lambda x: x[1])
+    if candidates != "all":
+        poipairs = candidate_poipairs_by_distance(G, pois, candidates, poidistances, router)
+        if len(poipairs) == 0: return None
+    else:
+        if poidistances is None:
+            poidistances = poi_distances(G, pois, router)
+        d = poidistances[1][np.triu_indices(len(poidistances[0]), k = 1)]
+        if not np.any(np.isfinite(d) & (d > 0)): return None
+        poipairs = poipairs_stream(*poidistances)
 
-        # Do the routing
-        GT_indices = set()
-        for poipair, poipair_distance in routenodepairs:
-            poipair_ind = (G.vs.find(id = poipair[0]).index, G.vs.find(id = poipair[1]).index)
-            sp = set(G.get_shortest_paths(poipair_ind[0], poipair_ind[1], weights = "weight", output = "vpath")[0])
-            GT_indices = GT_indices.union(sp)
+    # Run the whole GT and calculate its prune measure only once, then prune it for every quantile
+    GT_full = abstract_graph(G, pois_indices)
+    greedy_triangulation_edges(GT_full, poipairs)
+    set_prune_measure(GT_full, prune_measure)
+    return GT_full
 
-        GT = G.induced_subgraph(GT_indices)
-        GTs.append(GT)
+
+def random_edgeorder(GT, seed = 0):
+    """Random order of the edges of GT for the random prune measure, reproducible via seed.
+    """
+    random.seed(seed)
+    return random.sample(range(GT.ecount()), k = GT.ecount())
+
+
+def route_triangulation(G, GT_abstract, pathcache, router = None):
+    """Routes the edges of the abstract triangulation GT_abstract on G, shortest first,
+    and returns the induced subgraph of G. See routed_indices for pathcache and router.
+    """
     
-    return (GTs, GT_abstracts)
+    # Get node pairs we need to route, sorted by distance
+    routenodepairs = {}
+    for e in GT_abstract.es:
+        routenodepairs[(e.source_vertex["id"], e.target_vertex["id"])] = e["weight"]
+    routenodepairs = sorted(routenodepairs.items(), key = lambda x: x[1])
+
+    # Do the routing
+    GT_indices = routed_indices(G, [poipair for poipair, poipair_distance in routenodepairs], pathcache, router)
+    return G.induced_subgraph(GT_indices)
+
+
+def greedy_triangulation_routing_ensemble(G, pois, seeds = range(10), poidistances = None, router = None, candidates = "all", pathcache = None):
+    """Ensemble of random prune orders for the Greedy Triangulation of a graph G's
+    node subset pois, see greedy_triangulation_routing with prune_measure "random".
+    The full GT is triangulated only once and all its abstract edges are routed only 
+    once, into pathcache, so each seed only needs its edge order. The growth stages of 
+    a seed are rebuilt on demand from them with ensemble_growth, without routing.
+    Returns a dict with the full abstract GT "GT_full" (None if there is nothing to 
+    triangulate) and "edgeorders", a dict seed:edgeorder. Seed 0 gives the same stages 
+    as greedy_triangulation_growth.
+    """
     
+    GT_full = greedy_triangulation_full(G, pois, "random", poidistances, router, candidates)
+    if GT_full is None: return {"GT_full": None, "edgeorders": {seed: [] for seed in seeds}}
     
-def poipairs_by_distance(G, pois, return_distances = False):
-    """Calculates the (weighted) graph distances on G for a subset of nodes pois.
-    Returns all pairs of poi ids in ascending order of their distance. 
-    If return_distances, then distances are also returned.
+    if pathcache is None: pathcache = {} # routed paths, shared by all seeds and quantiles
+    route_triangulation(G, GT_full, pathcache, router)
+    return {"GT_full": GT_full, "edgeorders": {seed: random_edgeorder(GT_full, seed) for seed in seeds}}
+
+
+def ensemble_growth(G, ensemble, seed, prune_quantiles, pathcache, router = None):
+    """Yields the growth stages (prune_quantile, GT, GT_abstract) of seed of an ensemble from
+    greedy_triangulation_routing_ensemble, like greedy_triangulation_growth. With the pathcache
+    of the ensemble (or paths_from_ids of its stored paths), nothing needs to be routed.
     """
     
-    # Get poi indices
-    indices = []
-    for poi in pois:
-        indices.append(G_carall.vs.find(id = poi).index)
+    if ensemble["GT_full"] is None: return
+    for prune_quantile in prune_quantiles:
+        GT_abstract = prune_triangulation(ensemble["GT_full"], prune_quantile, "random", ensemble["edgeorders"][seed])
+        yield (prune_quantile, route_triangulation(G, GT_abstract, pathcache, router), GT_abstract)
+
+
+def aggregate_ensemble(outputs, z = 1.96):
+    """Aggregates the metrics of an ensemble, a list of outputs of calculate_metrics_additively
+    (dicts of metric:list over prune quantiles), to their mean and confidence band
+    mean +- z standard errors (95% for z = 1.96) per prune quantile.
+    Returns a dict of lists with the keys metric_mean, metric_cilow, metric_cihigh.
+    """
     
-    # Get sequences of nodes and edges in shortest paths between all pairs of pois
-    poi_nodes = []
-    poi_edges = []
-    for c, v in enumerate(indices):
-        poi_nodes.append(G.get_shortest_paths(v, indices[c:], weights = "weight", output = "vpath"))
-        poi_edges.append(G.get_shortest_paths(v, indices[c:], weights = "weight", output = "epath"))
-
-    # Sum up weights (distances) of all paths
-    poi_dist = {}
-    for paths_n, paths_e in zip(poi_nodes, poi_edges):
-        for path_n, path_e in zip(paths_n, paths_e):
-            # Sum up distances of path segments from first to last node
-            path_dist = sum([G.es[e]['weight'] for e in path_e])
-            if path_dist > 0:
-                poi_dist[(path_n[0],path_n[-1])] = path_dist
-            
-    temp = sorted(poi_dist.items(), key = lambda x: x[1])
-    # Back to ids
-    output = []
-    for p in temp:
-        output.append([(G.vs[p[0][0]]["id"], G.vs[p[0][1]]["id"]), p[1]])
+    aggregate = {}
+    n = len(outputs)
+    for key in outputs[0]:
+        values = np.array([output[key] for output in outputs], dtype = np.float64) # seeds x quantiles
+        mean = values.mean(axis = 0)
+        if n > 1:
+            halfwidth = z * values.std(axis = 0, ddof = 1) / math.sqrt(n)
+        else:
+            halfwidth = np.zeros_like(mean)
+        aggregate[key + "_mean"] = list(mean)
+        aggregate[key + "_cilow"] = list(mean - halfwidth)
+        aggregate[key + "_cihigh"] = list(mean + halfwidth)
+    return aggregate
+    
+    
+def routed_indices(G, nodepairs, pathcache, router = None):
+    """Routes all node id pairs nodepairs on G and returns the sorted vertex indices
+    of the union of their shortest paths.
+    pathcache is a dict from node id pairs to arrays of the vertex indices of their 
+    shortest path. Paths found there are reused, new paths are added to it.
+    If router is given, its path(s, t) method is used instead of G.get_shortest_paths.
+    """
+    idindex = get_idindex(G)
+    paths = []
+    for nodepair in nodepairs:
+        if nodepair not in pathcache:
+            nodepair_ind = (idindex[nodepair[0]], idindex[nodepair[1]])
+            if router is None:
+                path = G.get_shortest_paths(nodepair_ind[0], nodepair_ind[1], weights = "weight", output = "vpath")[0]
+            else:
+                path = router.path(nodepair_ind[0], nodepair_ind[1])
+            pathcache[nodepair] = np.array(path, dtype = np.int64)
+        paths.append(pathcache[nodepair])
+    if not paths: return []
+    return np.unique(np.concatenate(paths)).tolist()
+
+
+def poi_distances(G, pois, router = None):
+    """Calculates the (weighted) graph distances on G between all pairs of a subset of nodes pois,
+    with one Dijkstra sweep per poi, or with router.distances(sources, targets) if router is given.
+    Returns the list of poi ids (without duplicates) and the matrix of their distances as ndarray,
+    with np.inf for unconnected pairs.
+    """
+    poiids = list(dict.fromkeys(pois))
+    idindex = get_idindex(G)
+    indices = [idindex[poi] for poi in poiids]
+    if router is None:
+        D = np.array(G.distances(source = indices, target = indices, weights = "weight"), dtype = np.float64)
+    else:
+        D = np.asarray(router.distances(indices, indices), dtype = np.float64)
+    return poiids, D
+
+
+def poipairs_from_distances(poiids, D, return_distances = False):
+    """Returns all connected pairs of poi ids in ascending order of their distance,
+    given a distance matrix D as from poi_distances.
+    If return_distances, then distances are also returned.
+    """
+    i, j = np.triu_indices(len(poiids), k = 1)
+    d = D[i, j]
+    connected = np.isfinite(d) & (d > 0)
+    i, j, d = i[connected], j[connected], d[connected]
+    order = np.argsort(d, kind = "stable") # stable, so that ties keep the order of the pois
+    output = [[(poiids[a], poiids[b]), dist] for a, b, dist in zip(i[order].tolist(), j[order].tolist(), d[order].tolist())]
     
     if return_distances:
         return output
@@ -788,6 +1158,725 @@ def poipairs_by_distance(G, pois, return_distances = False):
         return [o[0] for o in output]
 
 
+def poipairs_stream(poiids, D, blocksize = 16):
+    """Generates the connected pairs of poi ids with their distance, [(id1, id2), distance],
+    lazily in ascending order of distance, given a distance matrix D as from poi_distances.
+    The order is the same as from poipairs_from_distances, but the pairs are never 
+    materialized: The sorted rows of D are merged with a heap, and each row is only 
+    sorted block by block as far as it is consumed.
+    """
+    n = len(poiids)
+
+    def nextblock(i, size, last = None):
+        # The next at least size pairs of row i after last = (distance, j), sorted by (distance, j)
+        j = np.arange(i+1, n)
+        row = D[i, i+1:]
+        valid = np.isfinite(row) & (row > 0)
+        if last is not None:
+            valid &= (row > last[0]) | ((row == last[0]) & (j > last[1]))
+        j, row = j[valid], row[valid]
+        if len(row) > size:
+            take = row <= np.partition(row, size-1)[size-1] # keep all ties with the threshold
+            j, row = j[take], row[take]
+        order = np.lexsort((j, row))
+        return list(zip(row[order].tolist(), j[order].tolist()))
+
+    heap = []
+    blocks = {}
+    for i in range(n-1):
+        blocks[i] = [nextblock(i, blocksize), 0, blocksize]
+        if blocks[i][0]:
+            d, j = blocks[i][0][0]
+            heap.append((d, i, j))
+    heapq.heapify(heap)
+
+    while heap:
+        d, i, j = heapq.heappop(heap)
+        yield [(poiids[i], poiids[j]), d]
+        block = blocks[i]
+        block[1] += 1
+        if block[1] == len(block[0]): # Row block consumed, sort the next (twice as large) block
+            block[2] *= 2
+            block[0], block[1] = nextblock(i, block[2], (d, j)), 0
+        if block[0]:
+            d, j = block[0][block[1]]
+            heapq.heappush(heap, (d, i, j))
+
+
+def poipairs_by_distance(G, pois, return_distances = False, router = None):
+    """Calculates the (weighted) graph distances on G for a subset of nodes pois.
+    Returns all pairs of poi ids in ascending order of their distance. 
+    If return_distances, then distances are also returned.
+    If router is given, it is used instead of G for the routing.
+    """
+    poiids, D = poi_distances(G, pois, router)
+    return poipairs_from_distances(poiids, D, return_distances)
+
+
+def extend_poi_distances(G, pois, poidistances = None, router = None):
+    """Returns the poi ids (without duplicates) and distance matrix of pois, as from poi_distances,
+    reusing the distances between pois that are in poidistances (for example of an earlier
+    set of pois). Only the pois that are missing there are routed, on G or on router if given.
+    Distances to these pois are routed from them, so they can differ from poi_distances 
+    in the last bit.
+    """
+    if poidistances is None: return poi_distances(G, pois, router)
+    poiids = list(dict.fromkeys(pois))
+    oldindex = {poi: i for i, poi in enumerate(poidistances[0])}
+    known = np.array([i for i, poi in enumerate(poiids) if poi in oldindex], dtype = np.int64)
+    missing = np.array([i for i, poi in enumerate(poiids) if poi not in oldindex], dtype = np.int64)
+    D = np.full((len(poiids), len(poiids)), np.inf)
+    rows = np.array([oldindex[poiids[i]] for i in known], dtype = np.int64)
+    D[np.ix_(known, known)] = poidistances[1][np.ix_(rows, rows)]
+    if len(missing):
+        idindex = get_idindex(G)
+        indices = [idindex[poi] for poi in poiids]
+        sources = [indices[i] for i in missing]
+        if router is None:
+            D_missing = np.array(G.distances(source = sources, target = indices, weights = "weight"), dtype = np.float64)
+        else:
+            D_missing = np.asarray(router.distances(sources, indices), dtype = np.float64)
+        D[missing, :] = D_missing
+        D[:, missing] = D_missing.T
+    return poiids, D
+
+
+def update_greedy_triangulation(res, G, pois, poidistances = None, router = None):
+    """Updates the GT results res of stage 03 inplace to a changed set of pois (node ids of G),
+    without running the whole GT again. Returns the prune quantiles whose GT has changed.
+    
+    The GT is the same up to the shortest pair of pois involving an added poi, or an edge of a
+    removed poi. Edges of shorter pairs are kept, and the GT is replayed from there on.
+    Then the GT is pruned again for all quantiles, and only abstract edges without a routed 
+    path in res["paths"] are routed. Only the GTs of changed quantiles are replaced.
+    res needs "pois" and "paths" (stored by stage 03), and the quantile 1, which is the full GT.
+    poidistances of the old (or new) pois are reused, see extend_poi_distances.
+    """
+    if "pois" not in res or "paths" not in res:
+        raise ValueError("The results have no pois or paths. Run stage 03 again to store them.")
+    if 1 not in res["prune_quantiles"]:
+        raise ValueError("The results have no full GT (prune quantile 1).")
+    prune_measure = res["prune_measure"]
+    oldpois = list(dict.fromkeys(res["pois"]))
+    newpois = list(dict.fromkeys(pois))
+    added = set(newpois) - set(oldpois)
+    removed = set(oldpois) - set(newpois)
+    if not added and not removed: return []
+    
+    idindex = get_idindex(G)
+    poidistances = extend_poi_distances(G, newpois, poidistances, router)
+    GT_old = res["GT_abstracts"][res["prune_quantiles"].index(1)]
+    
+    # The first pair of pois that is affected by the change
+    firstchange = math.inf
+    poiids, D = poidistances
+    for i, poi in enumerate(poiids):
+        if poi in added:
+            d = np.delete(D[i], i)
+            d = d[np.isfinite(d) & (d > 0)]
+            if len(d): firstchange = min(firstchange, d.min())
+    for e in GT_old.es:
+        if GT_old.vs[e.source]["id"] in removed or GT_old.vs[e.target]["id"] in removed:
+            firstchange = min(firstchange, e["weight"])
+    # Ties are ordered by the order of the pois, so it must be the same for the remaining pois
+    if [poi for poi in newpois if poi not in added] != [poi for poi in oldpois if poi not in removed]:
+        firstchange = 0
+    
+    # Keep the edges of shorter pairs, in the order they were added, and replay the rest
+    GT_full = abstract_graph(G, [idindex[poi] for poi in newpois])
+    abstractindex = get_idindex(GT_full)
+    kept = [e for e in GT_old.es if e["weight"] < firstchange]
+    GT_full.add_edges([(abstractindex[GT_old.vs[e.source]["id"]], abstractindex[GT_old.vs[e.target]["id"]]) for e in kept])
+    GT_full.es["weight"] = [e["weight"] for e in kept]
+    greedy_triangulation_edges(GT_full, (poipair for poipair in poipairs_stream(*poidistances) if poipair[1] >= firstchange))
+    set_prune_measure(GT_full, prune_measure)
+    if prune_measure == "random":
+        edgeorder = random_edgeorder(GT_full, 0) # const seed for reproducibility, as in greedy_triangulation_routing
+    else: 
+        edgeorder = False
+    
+    pathcache = paths_from_ids(G, res["paths"])
+    changed = []
+    for c, prune_quantile in enumerate(res["prune_quantiles"]):
+        GT_abstract = prune_triangulation(GT_full, prune_quantile, prune_measure, edgeorder)
+        unchanged = abstract_edge_ids(GT_abstract) == abstract_edge_ids(res["GT_abstracts"][c]) and set(GT_abstract.vs["id"]) == set(res["GT_abstracts"][c].vs["id"])
+        res["GT_abstracts"][c] = GT_abstract # also to update the prune measure
+        if unchanged: continue
+        changed.append(prune_quantile)
+        nodepairs = [(e.source_vertex["id"], e.target_vertex["id"]) for e in GT_abstract.es]
+        res["GTs"][c] = G.induced_subgraph(routed_indices(G, nodepairs, pathcache, router))
+    
+    if "MST" in res:
+        res["MST"], res["MST_abstract"] = mst_routing(G, newpois, poidistances, router, pathcache = pathcache)
+    res["pois"] = newpois
+    res["paths"] = paths_to_ids(G, pathcache, [(e.source_vertex["id"], e.target_vertex["id"]) for e in GT_full.es])
+    return changed
+
+
+def abstract_edge_ids(G):
+    """Set of the edges of G as sorted pairs of node ids.
+    """
+    ids = G.vs["id"] if G.vcount() else []
+    return set((min(ids[a], ids[b]), max(ids[a], ids[b])) for a, b in G.get_edgelist())
+
+
+def paths_to_ids(G, pathcache, nodepairs = None):
+    """Converts the routed paths of pathcache (see routed_indices) from vertex indices of G
+    to node ids, for storing them. If nodepairs is given, only their paths are kept.
+    """
+    if nodepairs is None: nodepairs = list(pathcache.keys())
+    ids = G.vs["id"]
+    paths = {}
+    for nodepair in nodepairs:
+        if nodepair in pathcache:
+            paths[nodepair] = [ids[v] for v in pathcache[nodepair].tolist()]
+        elif (nodepair[1], nodepair[0]) in pathcache:
+            paths[nodepair] = [ids[v] for v in pathcache[(nodepair[1], nodepair[0])][::-1].tolist()]
+    return paths
+
+
+def paths_from_ids(G, paths, reverse = True):
+    """Converts stored paths of node ids (see paths_to_ids) back to a pathcache of 
+    vertex indices of G (see routed_indices), with reverse in both directions.
+    """
+    idindex = get_idindex(G)
+    pathcache = {}
+    for nodepair, path in paths.items():
+        pathcache[nodepair] = np.array([idindex[nid] for nid in path], dtype = np.int64)
+        if reverse: pathcache[(nodepair[1], nodepair[0])] = pathcache[nodepair][::-1]
+    return pathcache
+
+
+def candidate_poipairs(G, pois, candidates = "delaunay", k = 8):
+    """Returns the list of poi ids (without duplicates) and the pairs of their indices (i, j) 
+    with i < j, sorted, that are candidates for edges of the GT: the edges of the euclidian
+    Delaunay triangulation of the pois ("delaunay"), or the pairs of each poi with its k 
+    nearest neighbors ("knn").
+    Pois that are not part of the triangulation (duplicate locations, or all collinear)
+    are paired with all other pois.
+    """
+    poiids = list(dict.fromkeys(pois))
+    idindex = get_idindex(G)
+    indices = [idindex[poi] for poi in poiids]
+    xy = np.column_stack((G.vs[indices]["x"], G.vs[indices]["y"])) if poiids else np.zeros((0, 2))
+    n = len(poiids)
+    pairs = set()
+    if candidates == "delaunay":
+        intriangulation = np.zeros(n, dtype = bool)
+        try:
+            tri = scipy.spatial.Delaunay(xy)
+            for simplex in tri.simplices.tolist():
+                for a, b in ((0, 1), (1, 2), (0, 2)):
+                    pairs.add((min(simplex[a], simplex[b]), max(simplex[a], simplex[b])))
+                intriangulation[simplex] = True
+        except (scipy.spatial.QhullError, ValueError): # Fewer than 3 pois, or all collinear
+            pass
+        for i in np.flatnonzero(~intriangulation).tolist():
+            pairs.update((min(i, j), max(i, j)) for j in range(n) if j != i)
+    elif candidates == "knn":
+        if n > 1:
+            neighbors = scipy.spatial.cKDTree(xy).query(xy, k = min(k+1, n))[1]
+            for i, row in enumerate(neighbors.tolist()):
+                pairs.update((min(i, j), max(i, j)) for j in row if j != i)
+    else:
+        raise ValueError("Unknown candidates: " + str(candidates))
+    return poiids, np.array(sorted(pairs), dtype = np.int64).reshape(-1, 2)
+
+
+def candidate_poipairs_by_distance(G, pois, candidates = "delaunay", poidistances = None, router = None):
+    """Returns the connected candidate pairs of poi ids (see candidate_poipairs) in ascending
+    order of their distance, with distances: [[(id1, id2), distance], ...]
+    Ties are in the same order as from poipairs_from_distances.
+    Distances are taken from poidistances if given, else only the candidate pairs are routed
+    on G, or on router if given, with one search per poi to its candidate partners.
+    """
+    poiids, pairs = candidate_poipairs(G, pois, candidates)
+    if poidistances is not None:
+        poiindex = {poi: i for i, poi in enumerate(poidistances[0])}
+        rows = np.array([poiindex[poi] for poi in poiids], dtype = np.int64)
+        d = poidistances[1][rows[pairs[:, 0]], rows[pairs[:, 1]]] if len(pairs) else np.zeros(0)
+    else:
+        idindex = get_idindex(G)
+        indices = np.array([idindex[poi] for poi in poiids], dtype = np.int64)
+        d = np.full(len(pairs), np.inf)
+        for i in np.unique(pairs[:, 0]).tolist():
+            sel = np.flatnonzero(pairs[:, 0] == i)
+            targets = indices[pairs[sel, 1]].tolist()
+            if router is None:
+                d[sel] = np.array(G.distances(source = [int(indices[i])], target = targets, weights = "weight"), dtype = np.float64)[0]
+            else:
+                d[sel] = np.asarray(router.distances([int(indices[i])], targets), dtype = np.float64)[0]
+    connected = np.isfinite(d) & (d > 0)
+    pairs, d = pairs[connected], d[connected]
+    order = np.argsort(d, kind = "stable") # pairs are sorted, so ties are in the same order as from poipairs_from_distances
+    return [[(poiids[a], poiids[b]), dist] for (a, b), dist in zip(pairs[order].tolist(), d[order].tolist())]
+
+
+def fast_gt_report(G, pois, candidates = "delaunay", poidistances = None, router = None):
+    """Verifies the fast GT with candidate pairs against the exact GT of the same pois.
+    Returns a dict with the numbers of candidate pairs and all pairs, the edges of both GTs, and of the
+    edges of the exact GT missing from the fast GT (missing) and vice versa (extra).
+    """
+    idindex = get_idindex(G)
+    pois_indices = set(idindex[poi] for poi in pois)
+    if poidistances is None:
+        poidistances = poi_distances(G, pois, router)
+    GT_exact = abstract_graph(G, pois_indices)
+    greedy_triangulation_edges(GT_exact, poipairs_stream(*poidistances))
+    GT_fast = abstract_graph(G, pois_indices)
+    poipairs = candidate_poipairs_by_distance(G, pois, candidates, poidistances)
+    greedy_triangulation_edges(GT_fast, poipairs)
+    edges_exact = set(tuple(sorted((GT_exact.vs[e.source]["id"], GT_exact.vs[e.target]["id"]))) for e in GT_exact.es)
+    edges_fast = set(tuple(sorted((GT_fast.vs[e.source]["id"], GT_fast.vs[e.target]["id"]))) for e in GT_fast.es)
+    n = len(poidistances[0])
+    return {"candidates": len(poipairs), "pairs": n*(n-1)//2, "edges_exact": len(edges_exact), "edges_fast": len(edges_fast), 
+            "missing": len(edges_exact - edges_fast), "extra": len(edges_fast - edges_exact)}
+
+
+def load_poi_distances(p, placeid, poi_source, G, pois, parameterid = "carall", router = None):
+    """Load the poi distance matrix of a city and poi_source from path p, as from poi_distances.
+    The matrix is calculated and saved if it is not available yet, or if the network
+    or poi files have changed since it was saved (checked via a hash of the files).
+    The file is shared by all prune measures and by the GT and MST.
+    If router is given, it is used instead of G to calculate the matrix.
+    """
+    filename = p + placeid + '_poi_' + poi_source + '_distances' + parameterid + '.npz'
+    filehash = hash_files(network_files(p, placeid, parameterid) + [p + placeid + '_poi_' + poi_source + '_nnids' + parameterid + '.csv'])
+    if os.path.isfile(filename):
+        with np.load(filename) as data:
+            if str(data["filehash"]) == filehash and data["poiids"].tolist() == list(dict.fromkeys(pois)):
+                return data["poiids"].tolist(), data["distances"]
+    
+    poiids, D = poi_distances(G, pois, router)
+    # Write to a temporary file first, so that parallel jobs never read a partial file
+    with open(filename + '.tmp', 'wb') as f:
+        np.savez_compressed(f, poiids = np.array(poiids, dtype = np.int64), distances = D, filehash = filehash)
+    os.replace(filename + '.tmp', filename)
+    return poiids, D
+
+
+
+class ALTRouter:
+    """Goal-directed shortest path queries on an undirected weighted ig graph G,
+    with A*, landmarks and the triangle inequality (ALT). See: goldberg2005csp
+    
+    The lower bound for the distance from a node v to the target t is the larger of
+    the haversine distance, scaled by the smallest ratio of edge weight to edge haversine
+    distance in G, and of |d(L, t) - d(L, v)| over all landmarks L. The landmarks are
+    chosen far apart, each farthest from the previous ones, and their distances to all
+    nodes are precomputed. 
+    The search settles far fewer nodes than Dijkstra, and the paths are the same as
+    from G.get_shortest_paths unless several paths are exactly equally long.
+    """
+    
+    def __init__(self, G, numlandmarks = 16):
+        self.G = G
+        n = G.vcount()
+        self.adj = [{} for v in range(n)] # with the shortest of multiple edges
+        for (a, b), w in zip(G.get_edgelist(), G.es["weight"] if G.ecount() else []):
+            if w < self.adj[a].get(b, math.inf):
+                self.adj[a][b] = self.adj[b][a] = w
+        self.adj = [list(a.items()) for a in self.adj]
+        self.lon = [math.radians(x) for x in G.vs["x"]] if n else []
+        self.lat = [math.radians(-y) for y in G.vs["y"]] if n else [] # y is mirrored
+        self.coslat = [math.cos(lat) for lat in self.lat]
+        
+        # Scale the haversine distance so that it is a lower bound on the edge weights
+        self.scale = math.inf
+        for (a, b), w in zip(G.get_edgelist(), G.es["weight"] if G.ecount() else []):
+            h = self.haversine(a, b)
+            if h > 0: self.scale = min(self.scale, w / h)
+        self.scale = 0 if self.scale == math.inf else self.scale * (1 - 1e-9) # margin for rounding
+        
+        self.landmarks = []
+        D = np.zeros((0, n))
+        mindist = np.zeros(n) if n else None
+        v = 0
+        for l in range(min(numlandmarks, n)):
+            d = np.array(G.distances(v, weights = "weight")[0], dtype = np.float64)
+            if l == 0: # The first landmark is the node farthest from node 0
+                v = int(np.argmax(np.where(np.isfinite(d), d, -1)))
+                d = np.array(G.distances(v, weights = "weight")[0], dtype = np.float64)
+            self.landmarks.append(v)
+            D = np.vstack((D, d))
+            mindist = np.where(np.isfinite(d), d, 0) if l == 0 else np.minimum(mindist, np.where(np.isfinite(d), d, 0))
+            v = int(np.argmax(mindist))
+        # One row of landmark distances per node. Unreachable is a large finite value instead of
+        # np.inf, so that the bound is huge exactly if v and t are not connected.
+        self.landmarkdistances = np.where(np.isfinite(D), D, 1e300).T.tolist()
+    
+    def haversine(self, a, b):
+        """Haversine distance in m between the nodes a and b.
+        """
+        h = math.sin((self.lat[b] - self.lat[a]) / 2)**2 + self.coslat[a] * self.coslat[b] * math.sin((self.lon[b] - self.lon[a]) / 2)**2
+        return 2 * 6371008.8 * math.asin(min(1, math.sqrt(h)))
+    
+    def path(self, s, t):
+        """The vertex indices of a shortest path from s to t, or [] if there is none.
+        """
+        Dt = self.landmarkdistances[t]
+        bounds = {}
+        def bound(v):
+            if v not in bounds:
+                bounds[v] = max([self.scale * self.haversine(v, t)] + [abs(a - b) for a, b in zip(self.landmarkdistances[v], Dt)])
+            return bounds[v]
+        
+        dist = {s: 0.0}
+        pred = {s: -1}
+        heap = [(bound(s), 0.0, s)]
+        while heap:
+            f, d, v = heapq.heappop(heap)
+            if d > dist[v]: continue
+            if v == t:
+                path = [t]
+                while pred[path[-1]] >= 0: path.append(pred[path[-1]])
+                return path[::-1]
+            for u, w in self.adj[v]:
+                if d + w < dist.get(u, math.inf): # Nodes can be reopened, so the bound needs not be consistent
+                    b = bound(u)
+                    if b > 1e299: continue # u is not connected to t
+                    dist[u] = d + w
+                    pred[u] = v
+                    heapq.heappush(heap, (d + w + b, d + w, u))
+        return []
+    
+    def distances(self, sources, targets):
+        """Matrix of the distances from all sources to all targets (vertex indices), with
+        np.inf for unconnected pairs. Goal direction does not help for many targets, so this 
+        is one Dijkstra sweep per source on G.
+        """
+        return np.array(self.G.distances(source = sources, target = targets, weights = "weight"), dtype = np.float64).reshape(len(sources), len(targets))
+
+
+class CSRGraph:
+    """Compact array representation of an undirected weighted ig graph, for example
+    from osm_to_ig, with routing via scipy.sparse.csgraph.
+    
+    Edges are stored in both directions in compressed sparse row (CSR) format: The 
+    neighbors of node v are indices[indptr[v]:indptr[v+1]], with float64 weights. Of 
+    multiple edges, only the shortest is kept, self-loops are dropped. Nodes have the 
+    coordinate arrays x, y and the node id array ids. 
+    Use from_ig and to_ig to convert at the boundaries with igraph code.
+    """
+    
+    def __init__(self, indptr, indices, weights, x, y, ids):
+        self.indptr, self.indices, self.weights = indptr, indices, weights
+        self.x, self.y, self.ids = x, y, ids
+        # Explicit zero weights are kept as edges by csgraph
+        self.matrix = scipy.sparse.csr_matrix((weights, indices, indptr), shape = (len(x), len(x)))
+        self.idindex = dict(zip(ids.tolist(), range(len(ids))))
+    
+    @classmethod
+    def from_ig(cls, G):
+        n = G.vcount()
+        edges = np.array(G.get_edgelist(), dtype = np.int64).reshape(-1, 2)
+        weights = np.array(G.es["weight"] if G.ecount() else [], dtype = np.float64)
+        keep = edges[:, 0] != edges[:, 1]
+        edges, weights = edges[keep], weights[keep]
+        a, b = np.concatenate((edges[:, 0], edges[:, 1])), np.concatenate((edges[:, 1], edges[:, 0]))
+        weights = np.concatenate((weights, weights))
+        # Sort by node, neighbor and weight, then keep the first (shortest) of multiple edges
+        order = np.lexsort((weights, b, a))
+        a, b, weights = a[order], b[order], weights[order]
+        first = np.ones(len(a), dtype = bool)
+        first[1:] = (a[1:] != a[:-1]) | (b[1:] != b[:-1])
+        a, b, weights = a[first], b[first], weights[first]
+        indptr = np.zeros(n+1, dtype = np.int64)
+        indptr[1:] = np.cumsum(np.bincount(a, minlength = n))
+        x = np.array(G.vs["x"] if n else [], dtype = np.float64)
+        y = np.array(G.vs["y"] if n else [], dtype = np.float64)
+        ids = node_ids(G) if n else np.zeros(0, dtype = np.int64)
+        return cls(indptr, b, weights, x, y, ids)
+    
+    def to_ig(self):
+        """Converts back to an ig graph with the node attributes x, y, id and the edge attribute weight.
+        """
+        a, b, weights = self.edges()
+        G = ig.Graph(n = len(self.x), edges = np.column_stack((a, b)).tolist(), directed = False)
+        G.vs["x"], G.vs["y"], G.vs["id"] = self.x.tolist(), self.y.tolist(), self.ids.tolist()
+        G.es["weight"] = weights.tolist()
+        build_idindex(G)
+        return G
+    
+    def vcount(self):
+        return len(self.x)
+    
+    def ecount(self):
+        return len(self.indices) // 2
+    
+    def edges(self):
+        """Arrays of the end nodes a < b and the weights of all edges.
+        """
+        a = np.repeat(np.arange(self.vcount()), np.diff(self.indptr))
+        upper = a < self.indices
+        return a[upper], self.indices[upper], self.weights[upper]
+    
+    def shortest_paths(self, sources, limit = np.inf):
+        """Distances (len(sources) x vcount matrix, np.inf if unconnected) and predecessors 
+        (-9999 if none) of one batched Dijkstra sweep from each of the sources, up to limit.
+        """
+        return csgraph.dijkstra(self.matrix, directed = True, indices = sources, return_predecessors = True, limit = limit)
+    
+    def distances(self, sources, targets = None):
+        """Matrix of the distances from all sources to all targets (or all nodes), 
+        with np.inf for unconnected pairs.
+        """
+        D = csgraph.dijkstra(self.matrix, directed = True, indices = np.asarray(sources, dtype = np.int64))
+        return D.reshape(len(sources), self.vcount()) if targets is None else D.reshape(len(sources), self.vcount())[:, targets]
+    
+    def path(self, s, t):
+        """The vertex indices of a shortest path from s to t, or [] if there is none.
+        """
+        D, P = self.shortest_paths([s])
+        return csr_path(P[0], s, t)
+
+
+def csr_path(predecessors, s, t):
+    """The path from s to t in a predecessor array from CSRGraph.shortest_paths, or [] if there is none.
+    """
+    if s == t: return [s]
+    if predecessors[t] < 0: return []
+    path = [t]
+    while path[-1] != s:
+        path.append(int(predecessors[path[-1]]))
+    return path[::-1]
+
+
+class SharedCSRPool:
+    """Process pool for batched shortest path distances on a CSRGraph C. The CSR arrays 
+    are put into shared memory once, so that the workers do not copy the graph.
+    Batches of sources are spread over the workers and the distance rows gathered back.
+    The workers are started once and can be given another graph with set_graph, so one 
+    pool can serve all graphs of a city (see distance_rows).
+    With processes = 1, no pool is started and all is calculated in this process.
+    Use as context manager, or call close() to stop the workers and free the memory.
+    Workers are forked, so this needs a platform with fork (Linux).
+    """
+    
+    def __init__(self, C = None, processes = None):
+        self.C = None
+        self.processes = available_cpus() if processes is None else processes
+        self.pool = None
+        self.shms = []
+        self.arrays = []
+        if self.processes > 1:
+            # Workers must share the resource tracker of this process, else each starts its own,
+            # which unlinks the shared arrays when the worker exits
+            resource_tracker.ensure_running()
+            self.pool = multiprocessing.get_context("fork").Pool(self.processes)
+        if C is not None: self.set_graph(C)
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, *args):
+        self.close()
+    
+    def set_graph(self, C):
+        """Route on the CSRGraph C from now on, replacing the shared arrays of the previous graph
+        """
+        self.free()
+        self.C = C
+        if self.pool is None: return
+        # int32 indices, as used by csgraph, so that workers need not convert (copy) them
+        for a in (C.weights, C.indices.astype(np.int32), C.indptr.astype(np.int32)):
+            shm = shared_memory.SharedMemory(create = True, size = max(a.nbytes, 1))
+            np.ndarray(a.shape, dtype = a.dtype, buffer = shm.buf)[:] = a
+            self.shms.append(shm)
+            self.arrays.append((shm.name, a.shape, a.dtype.str))
+    
+    def free(self):
+        # Workers still attached to the arrays keep them mapped until they attach to the next ones
+        for shm in self.shms:
+            shm.close()
+            shm.unlink()
+        self.shms = []
+        self.arrays = []
+    
+    def close(self):
+        if self.pool is not None:
+            self.pool.close()
+            self.pool.join()
+            self.pool = None
+        self.free()
+    
+    def batches(self, sources):
+        # About four batches per worker, to balance the load
+        size = max(1, math.ceil(len(sources) / (4 * self.processes)))
+        return [sources[i:i+size] for i in range(0, len(sources), size)]
+    
+    def distances(self, sources, targets = None):
+        """Matrix of the distances from all sources to all targets (or all nodes),
+        with np.inf for unconnected pairs.
+        """
+        sources = np.asarray(sources, dtype = np.int64)
+        if self.pool is None or len(sources) < 2:
+            return self.C.distances(sources, targets)
+        rows = self.pool.starmap(csr_worker_distances, [(self.arrays, self.C.vcount(), batch, targets) for batch in self.batches(sources)])
+        return np.vstack(rows)
+    
+    def nearest_sources(self, sourcesets, targets):
+        """For each set of source nodes, the distances from the nearest source to the 
+        targets, and the nearest sources, with one multi-source Dijkstra sweep per set.
+        """
+        if self.pool is None:
+            return [csr_nearest_sources(self.C.matrix, sources, targets) for sources in sourcesets]
+        return self.pool.starmap(csr_worker_nearest_sources, [(self.arrays, self.C.vcount(), sources, targets) for sources in sourcesets])
+    
+    def path(self, s, t):
+        return self.C.path(s, t)
+
+
+CSR_WORKER = {} # The shared memory and CSR matrix of a SharedCSRPool worker process
+
+
+def csr_worker_attach(arrays, n):
+    """Attaches a SharedCSRPool worker to the shared CSR arrays, without copying them,
+    unless it is attached to them already. Returns the CSR matrix.
+    """
+    if CSR_WORKER.get("arrays") != arrays:
+        CSR_WORKER["matrix"] = None # release the views of the previous arrays before closing them
+        for shm in CSR_WORKER.get("shms", []): # The parent process frees them
+            shm.close()
+        shms = [shared_memory.SharedMemory(name = name) for name, shape, dtype in arrays]
+        weights, indices, indptr = [np.ndarray(shape, dtype = dtype, buffer = shm.buf) for shm, (name, shape, dtype) in zip(shms, arrays)]
+        CSR_WORKER["arrays"] = arrays
+        CSR_WORKER["shms"] = shms
+        CSR_WORKER["matrix"] = scipy.sparse.csr_matrix((weights, indices, indptr), shape = (n, n), copy = False)
+    return CSR_WORKER["matrix"]
+
+
+def csr_worker_distances(arrays, n, sources, targets):
+    D = csgraph.dijkstra(csr_worker_attach(arrays, n), directed = True, indices = sources)
+    return D if targets is None else D[:, targets]
+
+
+def csr_worker_nearest_sources(arrays, n, sources, targets):
+    return csr_nearest_sources(csr_worker_attach(arrays, n), sources, targets)
+
+
+def csr_nearest_sources(matrix, sources, targets):
+    """Distances from the nearest of the sources to the targets, and the nearest sources
+    (-9999 if unconnected), with one multi-source Dijkstra sweep on a CSR matrix.
+    """
+    D, P, S = csgraph.dijkstra(matrix, directed = True, indices = sources, min_only = True, return_predecessors = True)
+    return D[targets], S[targets]
+
+
+def available_cpus():
+    """The number of CPUs to use: SLURM_CPUS_PER_TASK on the cluster, else all CPUs of this process.
+    """
+    if os.environ.get("SLURM_CPUS_PER_TASK"):
+        return int(os.environ["SLURM_CPUS_PER_TASK"])
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return os.cpu_count() or 1
+
+
+def distance_rows(G, sources, targets, pool = None, minvcount = 20000):
+    """Matrix of the (weighted) distances on the ig graph G from sources to targets (vertex indices),
+    with np.inf for unconnected pairs. If a SharedCSRPool pool (started once, for example per city) 
+    is given, G is routed on it, but only if G has at least minvcount nodes: sharing the graph with
+    the workers pays off only for large graphs, not for small GTs or abstract graphs.
+    """
+    if pool is not None and pool.pool is not None and len(sources) > 1 and G.vcount() >= minvcount:
+        pool.set_graph(CSRGraph.from_ig(G))
+        return pool.distances(sources, targets)
+    return np.array(G.distances(source = sources, target = targets, weights = "weight"), dtype = np.float64).reshape(len(sources), len(targets))
+
+
+class SimplifiedRouter:
+    """Routing on the ig graph G with all chains of degree 2 nodes contracted to single 
+    edges, as in the simplified networks, but keeping the nodes with the vertex indices keep
+    (for example the POIs). Each simplified edge keeps its chain of nodes of G, so found
+    paths are expanded back to paths of G. Of parallel chains, only the shortest is kept.
+    """
+    
+    def __init__(self, G, keep = []):
+        self.G = G
+        n = G.vcount()
+        edgelist = G.get_edgelist()
+        weights = G.es["weight"] if G.ecount() else []
+        self.kept = np.array(G.degree(), dtype = np.int64) != 2 if n else np.zeros(0, dtype = bool)
+        self.kept[list(keep)] = True
+        for (a, b) in edgelist:
+            if a == b: self.kept[a] = True
+        self.index = np.full(n, -1, dtype = np.int64)
+        self.index[self.kept] = np.arange(self.kept.sum())
+        
+        incident = G.get_inclist()
+        visited = np.zeros(len(edgelist), dtype = bool)
+        chains = {} # simplified edge (a, b) with a < b: (weight, chain of nodes from a to b)
+        for a in np.flatnonzero(self.kept).tolist():
+            for e in incident[a]:
+                if visited[e]: continue
+                visited[e] = True
+                chain = [a]
+                weight = weights[e]
+                v = edgelist[e][1] if edgelist[e][0] == a else edgelist[e][0]
+                while not self.kept[v]: # Follow the chain to the next kept node
+                    chain.append(v)
+                    e = incident[v][1] if incident[v][0] == e else incident[v][0]
+                    visited[e] = True
+                    weight += weights[e]
+                    v = edgelist[e][1] if edgelist[e][0] == v else edgelist[e][0]
+                chain.append(v)
+                if a == v: continue # A loop can not be part of a shortest path
+                key = (min(a, v), max(a, v))
+                if key not in chains or weight < chains[key][0]:
+                    chains[key] = (weight, chain if a < v else chain[::-1])
+        
+        self.Gs = ig.Graph(n = int(self.kept.sum()), edges = [(self.index[a], self.index[b]) for a, b in chains], directed = False)
+        self.Gs.es["weight"] = [weight for weight, chain in chains.values()]
+        self.chains = [chain for weight, chain in chains.values()]
+    
+    def path(self, s, t):
+        """The vertex indices of G of a shortest path from s to t, or [] if there is none.
+        """
+        if not (self.kept[s] and self.kept[t]):
+            return self.G.get_shortest_paths(s, t, weights = "weight", output = "vpath")[0]
+        if s == t: return [s]
+        epath = self.Gs.get_shortest_paths(self.index[s], self.index[t], weights = "weight", output = "epath")[0]
+        if not epath: return []
+        path = [s]
+        for e in epath:
+            chain = self.chains[e]
+            path += chain[1:] if chain[0] == path[-1] else chain[-2::-1]
+        return path
+    
+    def distances(self, sources, targets):
+        """Matrix of the distances from all sources to all targets (vertex indices of G),
+        with np.inf for unconnected pairs.
+        """
+        if self.kept[list(sources)].all() and self.kept[list(targets)].all():
+            D = self.Gs.distances(source = self.index[list(sources)].tolist(), target = self.index[list(targets)].tolist(), weights = "weight")
+        else:
+            D = self.G.distances(source = sources, target = targets, weights = "weight")
+        return np.array(D, dtype = np.float64).reshape(len(sources), len(targets))
+
+
+def load_router(p, placeid, G, routing = "igraph", parameterid = "carall", pois = []):
+    """Returns the router of the given type for the network G of a city, to pass to 
+    greedy_triangulation_routing, mst_routing or poipairs_by_distance:
+    igraph: None (G itself, the default), alt: ALTRouter, csr: CSRGraph, 
+    csrpool: SharedCSRPool on all available CPUs (close it when done), 
+    simplified: SimplifiedRouter keeping the nodes with ids pois.
+    """
+    if routing == "alt":
+        return ALTRouter(G)
+    elif routing == "csr":
+        return CSRGraph.from_ig(G)
+    elif routing == "csrpool":
+        return SharedCSRPool(CSRGraph.from_ig(G))
+    elif routing == "simplified":
+        idindex = get_idindex(G)
+        return SimplifiedRouter(G, [idindex[poi] for poi in pois])
+    elif routing == "igraph":
+        return None
+    raise ValueError("Unknown routing: " + str(routing))
+
+
 
 
 
@@ -829,26 +1918,23 @@ def count_and_merge(n, bearings):
     return count[::2] + count[1::2]
 
 
-def calculate_directness(G, numnodepairs = 500):
+def calculate_directness(G, numnodepairs = 500, pool = None):
     """Calculate directness on G over all connected node pairs in indices. This calculation method divides the total sum of euclidian distances by total sum of network distances.
+    Network distances are routed with distance_rows, on the SharedCSRPool pool if given.
     """
     
     indices = random.sample(list(G.vs), min(numnodepairs, len(G.vs)))
+    D = distance_rows(G, [v.index for v in indices], [v.index for v in indices], pool)
 
-    poi_edges = []
     total_distance_direct = 0
-    for c, v in enumerate(indices):
-        poi_edges.append(G.get_shortest_paths(v, indices[c:], weights = "weight", output = "epath"))
-        temp = G.get_shortest_paths(v, indices[c:], weights = "weight", output = "vpath")
-        try:
-            total_distance_direct += sum(dist_vector([(G.vs[t[0]]["y"], G.vs[t[0]]["x"]) for t in temp], [(G.vs[t[-1]]["y"], G.vs[t[-1]]["x"]) for t in temp])) # must be in format lat,lon = y, x
-        except: # Rarely, routing does not work. Unclear why.
-            pass
     total_distance_network = 0
-    for paths_e in poi_edges:
-        for path_e in paths_e:
-            # Sum up distances of path segments from first to last node
-            total_distance_network += sum([G.es[e]['weight'] for e in path_e])
+    for c, v in enumerate(indices):
+        row = D[c, c:].tolist()
+        # If a node pair of the row is not connected, the euclidian distances of the whole row are left out
+        if all(d < math.inf for d in row):
+            total_distance_direct += sum(dist_vector([(v["y"], v["x"])] * len(row), [(t["y"], t["x"]) for t in indices[c:]])) # must be in format lat,lon = y, x
+        for d in row:
+            if d < math.inf: total_distance_network += d
     
     return total_distance_direct / total_distance_network
 
@@ -880,17 +1966,13 @@ def listmean(lst):
     try: return sum(lst) / len(lst)
     except: return 0
 
-def calculate_coverage_edges(G, buffer_m = 500, return_cov = False, G_prev = ig.Graph(), cov_prev = Polygon()):
-    """Calculates the area and shape covered by the graph's edges.
-    If G_prev and cov_prev are given, only the difference between G and G_prev are calculated, then added to cov_prev.
+def coverage_projection(G):
+    """Local azimuthal equidistant projection centred on the mean of G's nodes,
+    as pair of pyproj transformers (wgs84_to_aeqd, aeqd_to_wgs84).
     """
-
-    G_added = copy.deepcopy(G)
-    delete_overlaps(G_added, G_prev)
-
     # https://gis.stackexchange.com/questions/121256/creating-a-circle-with-radius-in-metres
-    loncenter = listmean([v["x"] for v in G.vs])
-    latcenter = listmean([v["y"] for v in G.vs])
+    loncenter = listmean(G.vs["x"])
+    latcenter = listmean(G.vs["y"])
     local_azimuthal_projection = "+proj=aeqd +R=6371000 +units=m +lat_0={} +lon_0={}".format(latcenter, loncenter)
     # Use transformer: https://gis.stackexchange.com/questions/127427/transforming-shapely-polygon-and-multipolygon-objects
     wgs84_to_aeqd = pyproj.Transformer.from_proj(
@@ -899,23 +1981,246 @@ def calculate_coverage_edges(G, buffer_m = 500, return_cov = False, G_prev = ig.
     aeqd_to_wgs84 = pyproj.Transformer.from_proj(
         pyproj.Proj(local_azimuthal_projection),
         pyproj.Proj("+proj=longlat +datum=WGS84 +no_defs"))
-    edgetuples = [((e.source_vertex["x"], e.source_vertex["y"]), (e.target_vertex["x"], e.target_vertex["y"])) for e in G_added.es]
+    return (wgs84_to_aeqd, aeqd_to_wgs84)
+
+
+def get_coverage_projection(G):
+    """Return the coverage_projection of G, building it if G has none yet.
+    Use the one of the whole city (for example G_carall) for all coverages of the city,
+    so that they are measured in the same projection.
+    """
+    projection = getattr(G, "coverage_projection", None)
+    if projection is None:
+        projection = coverage_projection(G)
+        G.coverage_projection = projection
+    return projection
+
+
+def transform_geometry(geometry, transformer):
+    """Transform all coordinates of a shapely geometry with a pyproj transformer in one call
+    """
+    return shapely.transform(geometry, lambda coords: np.column_stack(transformer.transform(coords[:, 0], coords[:, 1])))
+
+
+def edge_buffers(G, buffer_m, projection):
+    """Buffers of buffer_m meters around all edges of G, as shapely geometry array in the projected
+    coordinates of projection (see coverage_projection). All edges are buffered at once.
+    """
+    x, y = projection[0].transform(np.array(G.vs["x"]), np.array(G.vs["y"]))
+    edges = np.array(G.get_edgelist()).reshape(-1, 2)
+    lines = shapely.linestrings(np.stack([np.column_stack([x[edges[:, 0]], y[edges[:, 0]]]), np.column_stack([x[edges[:, 1]], y[edges[:, 1]]])], axis = 1))
+    return shapely.buffer(lines, buffer_m, quad_segs = 16)
+
+
+def buffer_edges(G, buffer_m, projection):
+    """Merged buffers of buffer_m meters around all edges of G, in the projected coordinates of
+    projection (see coverage_projection), merged with a single union.
+    """
+    if not G.ecount(): return Polygon()
+    return shapely.union_all(edge_buffers(G, buffer_m, projection))
+
+
+class CoverageRaster:
+    """Coverage of a city's growing network on a fixed grid of resolution meters in the city's
+    coverage_projection, as alternative to the polygon covers of calculate_coverage_edges.
+    Adding edges only burns their buffers into the bitmaps, and areas and covered POIs are pixel counts.
+    
+    Three bitmaps are kept, compressed: the pixels whose centre is covered (the estimate),
+    the pixels touched by the cover (an upper bound of the vector cover), and the pixels fully
+    inside the cover (a lower bound), see error.
+    """
+    
+    def __init__(self, G, buffer_m = 500, resolution = 10):
+        """Grid over the nodes of G (the whole city, for example G_carall) plus buffer_m
+        """
+        self.buffer_m = buffer_m
+        self.resolution = resolution
+        self.set_grid(G, buffer_m + resolution)
+        self.bitmaps = {}
+        for name in ["center", "inner", "touched"]:
+            self.set_bitmap(name, np.zeros(self.shape, dtype = bool))
+    
+    def set_grid(self, G, margin):
+        """Grid over the nodes of G plus margin meters
+        """
+        self.projection = get_coverage_projection(G)
+        x, y = self.projection[0].transform(np.array(G.vs["x"]), np.array(G.vs["y"]))
+        self.shape = (int(math.ceil((y.max() - y.min() + 2 * margin) / self.resolution)), int(math.ceil((x.max() - x.min() + 2 * margin) / self.resolution)))
+        self.transform = rasterio.transform.from_origin(x.min() - margin, y.max() + margin, self.resolution, self.resolution)
+    
+    def window(self, bounds, margin = 0):
+        """Slices of the grid (rows, cols) covering bounds (minx, miny, maxx, maxy) plus margin meters,
+        and the transform of the window
+        """
+        minx, miny, maxx, maxy = bounds
+        x0, y0 = self.transform.c, self.transform.f
+        row0 = max(int(math.floor((y0 - maxy - margin) / self.resolution)), 0)
+        row1 = min(int(math.ceil((y0 - miny + margin) / self.resolution)), self.shape[0])
+        col0 = max(int(math.floor((minx - margin - x0) / self.resolution)), 0)
+        col1 = min(int(math.ceil((maxx + margin - x0) / self.resolution)), self.shape[1])
+        windowtransform = rasterio.transform.from_origin(x0 + col0 * self.resolution, y0 - row0 * self.resolution, self.resolution, self.resolution)
+        return (slice(row0, row1), slice(col0, col1), windowtransform)
+    
+    def bitmap(self, name = "center"):
+        return np.unpackbits(np.frombuffer(zlib.decompress(self.bitmaps[name]), dtype = np.uint8), count = self.shape[0] * self.shape[1]).reshape(self.shape).astype(bool)
+    
+    def set_bitmap(self, name, bitmap):
+        self.bitmaps[name] = zlib.compress(np.packbits(bitmap).tobytes(), 1)
+    
+    def add_edges(self, G):
+        """Burn the merged buffers of the edges of G into the bitmaps, within the window of their bounds
+        """
+        if not G.ecount(): return
+        cov = buffer_edges(G, self.buffer_m, self.projection)
+        rows, cols, windowtransform = self.window(cov.bounds)
+        window = (rows.stop - rows.start, cols.stop - cols.start)
+        
+        center = rasterio.features.rasterize([cov], window, transform = windowtransform, all_touched = False, dtype = np.uint8).astype(bool)
+        boundary = rasterio.features.rasterize([cov.boundary], window, transform = windowtransform, all_touched = True, dtype = np.uint8).astype(bool)
+        # A pixel touched by the cover either has its centre inside or is touched by the boundary,
+        # and a pixel with its centre inside that the boundary does not touch lies fully inside
+        for name, added in [("center", center), ("touched", center | boundary), ("inner", center & ~boundary)]:
+            bitmap = self.bitmap(name)
+            bitmap[rows, cols] |= added
+            self.set_bitmap(name, bitmap)
+    
+    def area(self, name = "center"):
+        """Covered area in km2
+        """
+        return int(np.unpackbits(np.frombuffer(zlib.decompress(self.bitmaps[name]), dtype = np.uint8)).sum()) * self.resolution**2 / 1000000
+    
+    def error(self):
+        """Bound of the difference in km2 between area and the area of the vector cover
+        """
+        area = self.area()
+        return max(area - self.area("inner"), self.area("touched") - area)
+    
+    def pixels(self, G, nnids):
+        """Grid rows and columns of the nodes of G given by nnids
+        """
+        x, y = self.projection[0].transform(*get_poi_coordinates(G, nnids))
+        rows, cols = rasterio.transform.rowcol(self.transform, x, y)
+        return (np.array(rows), np.array(cols))
+    
+    def poiscovered(self, G, nnids):
+        """How many nodes of G, given by nnids, lie in covered pixels
+        """
+        rows, cols = self.pixels(G, nnids)
+        return int(self.bitmap()[rows, cols].sum())
+    
+    def polygon(self):
+        """The covered pixels as shapely (multi)polygon in WGS84, like the covers of calculate_coverage_edges
+        """
+        pols = [shapely.geometry.shape(geom) for geom, value in rasterio.features.shapes(self.bitmap().astype(np.uint8), transform = self.transform) if value]
+        if not pols: return Polygon()
+        return transform_geometry(shapely.union_all(pols), self.projection[1])
+
+
+class CoverageRadii(CoverageRaster):
+    """Raster coverage of a city's growing network for several walking distances (radii) at once.
+    For every pixel it keeps the distance to the network as band, the number of thresholds
+    (each radius, and each radius -+ a pixel diagonal for the error bounds) it lies within,
+    so that the coverage for all radii comes from one distance transform per growth stage.
+    The distance transform measures from the centres of the pixels that the edges touch, which is 
+    off by at most half a pixel diagonal. bitmap, area, error and poiscovered are those of 
+    CoverageRaster for radius (by default buffer_m).
+    """
+    
+    def __init__(self, G, buffer_m = 500, resolution = 10, radii = [250, 500, 750, 1000]):
+        self.buffer_m = buffer_m
+        self.resolution = resolution
+        self.radii = sorted(set(radii) | {buffer_m})
+        delta = resolution * math.sqrt(2) / 2
+        self.thresholds = np.array(sorted(set(r + s * 2 * delta for r in self.radii for s in [-1, 0, 1])))
+        self.set_grid(G, self.thresholds[-1] + resolution)
+        self.set_bands(np.zeros(self.shape, dtype = np.uint8))
+    
+    def bands(self):
+        return np.frombuffer(zlib.decompress(self.bandmap), dtype = np.uint8).reshape(self.shape)
+    
+    def set_bands(self, bands):
+        self.bandmap = zlib.compress(np.ascontiguousarray(bands).tobytes(), 1)
+        # Pixels per band, so that areas need not decompress the bands
+        self.bandcounts = np.bincount(bands.ravel(), minlength = len(self.thresholds) + 1)
+    
+    def level(self, name = "center", radius = None):
+        """Band from which pixels are covered by radius: within it (center), fully inside (inner), or touched by it (touched)
+        """
+        if radius is None: radius = self.buffer_m
+        delta = self.resolution * math.sqrt(2) / 2
+        threshold = radius + {"inner": -2 * delta, "center": 0, "touched": 2 * delta}[name]
+        return len(self.thresholds) - int(np.argmin(np.abs(self.thresholds - threshold)))
+    
+    def bitmap(self, name = "center", radius = None):
+        return self.bands() >= self.level(name, radius)
+    
+    def add_edges(self, G):
+        """Rasterise the edges of G and merge the bands of their distance transform into the bands,
+        within the window of their bounds plus the largest threshold
+        """
+        if not G.ecount(): return
+        x, y = self.projection[0].transform(np.array(G.vs["x"]), np.array(G.vs["y"]))
+        edges = np.array(G.get_edgelist()).reshape(-1, 2)
+        lines = shapely.linestrings(np.stack([np.column_stack([x[edges[:, 0]], y[edges[:, 0]]]), np.column_stack([x[edges[:, 1]], y[edges[:, 1]]])], axis = 1))
+        rows, cols, windowtransform = self.window((x.min(), y.min(), x.max(), y.max()), self.thresholds[-1] + self.resolution)
+        window = (rows.stop - rows.start, cols.stop - cols.start)
+        
+        network = rasterio.features.rasterize(list(lines), window, transform = windowtransform, all_touched = True, dtype = np.uint8)
+        distances = scipy.ndimage.distance_transform_edt(1 - network, sampling = self.resolution)
+        added = (len(self.thresholds) - np.searchsorted(self.thresholds, distances, side = "left")).astype(np.uint8)
+        bands = self.bands().copy()
+        np.maximum(bands[rows, cols], added, out = bands[rows, cols])
+        self.set_bands(bands)
+    
+    def area(self, name = "center", radius = None):
+        """Covered area in km2
+        """
+        return int(self.bandcounts[self.level(name, radius):].sum()) * self.resolution**2 / 1000000
+    
+    def error(self, radius = None):
+        """Bound of the difference in km2 between area and the area of the vector cover
+        """
+        area = self.area(radius = radius)
+        return max(area - self.area("inner", radius), self.area("touched", radius) - area)
+    
+    def poiscovered(self, G, nnids, radius = None):
+        """How many nodes of G, given by nnids, lie in pixels covered by radius
+        """
+        rows, cols = self.pixels(G, nnids)
+        return int(np.count_nonzero(self.bands()[rows, cols] >= self.level("center", radius)))
+
+
+def calculate_coverage_edges(G, buffer_m = 500, return_cov = False, G_prev = ig.Graph(), cov_prev = Polygon(), projection = None):
+    """Calculates the area and shape covered by the graph's edges.
+    If G_prev and cov_prev are given, only the difference between G and G_prev are calculated, then added to cov_prev.
+    projection (see get_coverage_projection) should be the same for all graphs of a city,
+    by default it is centred on G. If cov_prev is a CoverageRaster, the raster is extended instead.
+    """
+
+    G_added = G.copy() # delete_overlaps only deletes edges and nodes, so attribute values can be shared
+    delete_overlaps(G_added, G_prev)
+    if isinstance(cov_prev, CoverageRaster):
+        cov = copy.deepcopy(cov_prev)
+        cov.add_edges(G_added)
+        if return_cov:
+            return (cov.area(), cov)
+        else:
+            return cov.area()
+    if projection is None:
+        projection = coverage_projection(G)
+    wgs84_to_aeqd, aeqd_to_wgs84 = projection
+
     # Shapely buffer seems slow for complex objects: https://stackoverflow.com/questions/57753813/speed-up-shapely-buffer
-    # Therefore we buffer piecewise.
-    cov_added = Polygon()
-    for c, t in enumerate(edgetuples):
-        # if cov.geom_type == 'MultiPolygon' and c % 1000 == 0: print(str(c)+"/"+str(len(edgetuples)), sum([len(pol.exterior.coords) for pol in cov]))
-        # elif cov.geom_type == 'Polygon' and c % 1000 == 0: print(str(c)+"/"+str(len(edgetuples)), len(pol.exterior.coords))
-        buf = ops.transform(aeqd_to_wgs84.transform, ops.transform(wgs84_to_aeqd.transform, LineString(t)).buffer(buffer_m))
-        cov_added = ops.unary_union([cov_added, Polygon(buf)])
+    # Therefore we buffer piecewise, all pieces at once, and merge them with one union.
+    cov_added = buffer_edges(G_added, buffer_m, projection)
 
     # Merge with cov_prev
     if not cov_added.is_empty: # We need this check because apparently an empty Polygon adds an area.
-        cov = ops.unary_union([cov_added, cov_prev])
+        cov = shapely.union_all([transform_geometry(cov_added, aeqd_to_wgs84), cov_prev])
     else:
         cov = cov_prev
 
-    cov_transformed = ops.transform(wgs84_to_aeqd.transform, cov)
+    cov_transformed = transform_geometry(cov, wgs84_to_aeqd)
     covered_area = cov_transformed.area / 1000000 # turn from m2 to km2
 
     if return_cov:
@@ -926,25 +2231,22 @@ def calculate_coverage_edges(G, buffer_m = 500, return_cov = False, G_prev = ig.
 
 def calculate_poiscovered(G, cov, nnids):
     """Calculates how many nodes, given by nnids, are covered by the shapely (multi)polygon cov
+    (or by a CoverageRaster)
     """
     
-    pois_indices = set()
-    for poi in nnids:
-        pois_indices.add(G.vs.find(id = poi).index)
+    if isinstance(cov, CoverageRaster):
+        return cov.poiscovered(G, nnids)
 
-    poiscovered = 0
-    for poi in pois_indices:
-        v = G.vs[poi]
-        if Point(v["x"], v["y"]).within(cov):
-            poiscovered += 1
-    
-    return poiscovered
+    x, y = get_poi_coordinates(G, nnids)
+    shapely.prepare(cov)
+    return int(np.count_nonzero(shapely.contains_xy(cov, x, y)))
 
 
-def calculate_efficiency_global(G, numnodepairs = 500, normalized = True):
+def calculate_efficiency_global(G, numnodepairs = 500, normalized = True, pool = None):
     """Calculates global network efficiency.
     If there are more than numnodepairs nodes, measure over pairings of a 
     random sample of numnodepairs nodes.
+    Network distances are routed with distance_rows, on the SharedCSRPool pool if given.
     """
 
     if G is None: return 0
@@ -952,32 +2254,22 @@ def calculate_efficiency_global(G, numnodepairs = 500, normalized = True):
         nodeindices = random.sample(list(G.vs.indices), numnodepairs)
     else:
         nodeindices = list(G.vs.indices)
-    d_ij = G.shortest_paths(source = nodeindices, target = nodeindices, weights = "weight")
-    d_ij = [item for sublist in d_ij for item in sublist] # flatten
-    EG = sum([1/d for d in d_ij if d != 0])
+    d_ij = distance_rows(G, nodeindices, nodeindices, pool)
+    EG = reciprocal_sum(d_ij)
     if not normalized: return EG
-    pairs = list(itertools.permutations(nodeindices, 2))
-    if len(pairs) < 1: return 0
-    l_ij = dist_vector([(G.vs[p[0]]["y"], G.vs[p[0]]["x"]) for p in pairs],
-                            [(G.vs[p[1]]["y"], G.vs[p[1]]["x"]) for p in pairs]) # must be in format lat,lon = y,x
-    EG_id = sum([1/l for l in l_ij if l != 0])
-    # if (EG / EG_id) > 1: # This should not be allowed to happen!
-    #     pp.pprint(d_ij)
-    #     pp.pprint(l_ij)
-    #     pp.pprint([e for e in G.es])
-    #     print(pairs)
-    #     print([(G.vs[p[0]]["y"], G.vs[p[0]]["x"]) for p in pairs],
-    #                         [(G.vs[p[1]]["y"], G.vs[p[1]]["x"]) for p in pairs]) # must be in format lat,lon = y,x
-    #     print(EG, EG_id)
-    #     sys.exit()
+    if len(nodeindices) < 2: return 0
+    l_ij = dist_matrix(G.vs[nodeindices]["y"], G.vs[nodeindices]["x"]) # must be in format lat,lon = y,x
+    EG_id = reciprocal_sum(l_ij)
     # assert EG / EG_id <= 1, "Normalized EG > 1. This should not be possible."
     return EG / EG_id
 
 
-def calculate_efficiency_local(G, numnodepairs = 500, normalized = True):
+def calculate_efficiency_local(G, numnodepairs = 500, normalized = True, batchsize = 2000):
     """Calculates local network efficiency.
     If there are more than numnodepairs nodes, measure over pairings of a 
     random sample of numnodepairs nodes.
+    The induced subgraphs of the neighborhoods are routed together, as blocks of a 
+    block diagonal csgraph of up to batchsize nodes.
     """
 
     if G is None: return 0
@@ -985,13 +2277,44 @@ def calculate_efficiency_local(G, numnodepairs = 500, normalized = True):
         nodeindices = random.sample(list(G.vs.indices), numnodepairs)
     else:
         nodeindices = list(G.vs.indices)
-    EGi = []
-    vcounts = []
-    ecounts = []
+    neighborhoods = []
     for i in nodeindices:
-        if len(G.neighbors(i)) > 1: # If we have a nontrivial neighborhood
-            G_induced = G.induced_subgraph(G.neighbors(i))
-            EGi.append(calculate_efficiency_global(G_induced, numnodepairs, normalized))
+        neighbors = G.neighbors(i)
+        if len(neighbors) > 1: # If we have a nontrivial neighborhood
+            neighbors = sorted(set(neighbors))
+            if len(neighbors) > numnodepairs:
+                neighbors = random.sample(neighbors, numnodepairs)
+            neighborhoods.append(neighbors)
+    if not neighborhoods: return 0
+
+    matrix = CSRGraph.from_ig(G).matrix
+    x, y = np.array(G.vs["x"], dtype = np.float64), np.array(G.vs["y"], dtype = np.float64)
+    EGi = []
+    batch = []
+    for k, neighbors in enumerate(neighborhoods):
+        batch.append(neighbors)
+        if k < len(neighborhoods) - 1 and sum(len(b) for b in batch) + len(neighborhoods[k+1]) <= batchsize: continue
+        
+        sizes = np.array([len(b) for b in batch])
+        nodes = np.concatenate(batch)
+        block = np.repeat(np.arange(len(batch)), sizes)
+        n = len(nodes)
+        # Block diagonal matrix of the induced subgraphs
+        sub = matrix[nodes][:, nodes].tocoo()
+        keep = block[sub.row] == block[sub.col]
+        blockmatrix = scipy.sparse.csr_matrix((sub.data[keep], (sub.row[keep], sub.col[keep])), shape = (n, n))
+        D = csgraph.dijkstra(blockmatrix, directed = True)
+        # All pairs of nodes within each block
+        starts = np.cumsum(sizes) - sizes
+        rows = np.repeat(np.arange(n), sizes[block])
+        cols = np.arange(len(rows)) - np.repeat(np.cumsum(sizes[block]) - sizes[block], sizes[block]) + np.repeat(starts[block], sizes[block])
+        EG = np.bincount(block[rows], weights = reciprocals(D[rows, cols]), minlength = len(batch))
+        if normalized:
+            l_ij = dist_vector(np.column_stack((y[nodes[rows]], x[nodes[rows]])), np.column_stack((y[nodes[cols]], x[nodes[cols]]))) # must be in format lat,lon = y,x
+            EG_id = np.bincount(block[rows], weights = reciprocals(l_ij), minlength = len(batch))
+            EG = np.divide(EG, EG_id, out = np.zeros(len(batch)), where = sizes > 1)
+        EGi.extend(EG.tolist())
+        batch = []
     return listmean(EGi)
 
 
@@ -1008,14 +2331,16 @@ def calculate_metrics(G, GT_abstract, G_big, nnids, calcmetrics = {"length":0,
           "efficiency_local": 0,
           "directness_lcc_linkwise": 0,
           "directness_all_linkwise": 0
-         }, buffer_walk = 500, numnodepairs = 500, verbose = False, return_cov = True, G_prev = ig.Graph(), cov_prev = Polygon(), ignore_GT_abstract = False, Gexisting = {}):
+         }, buffer_walk = 500, numnodepairs = 500, verbose = False, return_cov = True, G_prev = ig.Graph(), cov_prev = Polygon(), ignore_GT_abstract = False, Gexisting = {}, pool = None):
     """Calculates all metrics (using the keys from calcmetrics).
+    Shortest paths for directness and global efficiency are routed on the SharedCSRPool pool, see distance_rows.
     """
     
     output = {}
     for key in calcmetrics:
         output[key] = 0
-    cov = Polygon()
+    # Carry a raster coverage over stages without links, so that the next stage extends it (instead of a Polygon)
+    cov = copy.deepcopy(cov_prev) if isinstance(cov_prev, CoverageRaster) else Polygon()
 
     # Check that the graph has links (sometimes we have an isolated node)
     if G.ecount() > 0 and GT_abstract.ecount() > 0:
@@ -1028,7 +2353,7 @@ def calculate_metrics(G, GT_abstract, G_big, nnids, calcmetrics = {"length":0,
         if not ignore_GT_abstract:
             if verbose and ("efficiency_global" in calcmetrics or "efficiency_local" in calcmetrics): print("Calculating efficiency...")
             if "efficiency_global" in calcmetrics:
-                output["efficiency_global"] = calculate_efficiency_global(GT_abstract, numnodepairs)
+                output["efficiency_global"] = calculate_efficiency_global(GT_abstract, numnodepairs, pool = pool)
             if "efficiency_local" in calcmetrics:
                 output["efficiency_local"] = calculate_efficiency_local(GT_abstract, numnodepairs) 
         
@@ -1036,7 +2361,7 @@ def calculate_metrics(G, GT_abstract, G_big, nnids, calcmetrics = {"length":0,
         if verbose and ("efficiency_global_routed" in calcmetrics or "efficiency_local_routed" in calcmetrics): print("Calculating efficiency (routed)...")
         if "efficiency_global_routed" in calcmetrics:
             try:
-                output["efficiency_global_routed"] = calculate_efficiency_global(simplify_ig(G), numnodepairs)
+                output["efficiency_global_routed"] = calculate_efficiency_global(simplify_ig(G), numnodepairs, pool = pool)
             except:
                 print("Problem with efficiency_global_routed.") # This try is needed for some pathological cases, for example loops generating empty graphs (only happened in Zurich, railwaystation/closeness)
                 pass
@@ -1061,8 +2386,16 @@ def calculate_metrics(G, GT_abstract, G_big, nnids, calcmetrics = {"length":0,
         if "coverage" in calcmetrics:
             if verbose: print("Calculating coverage...")
             # G_added = G.difference(G_prev) # This doesnt work
-            covered_area, cov = calculate_coverage_edges(G, buffer_walk, return_cov, G_prev, cov_prev)
+            covered_area, cov = calculate_coverage_edges(G, buffer_walk, return_cov, G_prev, cov_prev, get_coverage_projection(G_big))
             output["coverage"] = covered_area
+            if "coverage_error" in calcmetrics:
+                output["coverage_error"] = cov.error() if isinstance(cov, CoverageRaster) else 0
+            if isinstance(cov, CoverageRadii):
+                for radius in cov.radii:
+                    if "coverage_" + str(radius) in calcmetrics:
+                        output["coverage_" + str(radius)] = cov.area(radius = radius)
+                    if "poi_coverage_" + str(radius) in calcmetrics:
+                        output["poi_coverage_" + str(radius)] = cov.poiscovered(G_big, nnids, radius)
             # OVERLAP WITH EXISTING NETS
             if Gexisting:
                 if "overlap_biketrack" in calcmetrics:
@@ -1089,10 +2422,10 @@ def calculate_metrics(G, GT_abstract, G_big, nnids, calcmetrics = {"length":0,
         # DIRECTNESS
         if verbose and ("directness" in calcmetrics or "directness_lcc" in calcmetrics): print("Calculating directness...")
         if "directness" in calcmetrics:
-            output["directness"] = calculate_directness(G, numnodepairs)
+            output["directness"] = calculate_directness(G, numnodepairs, pool)
         if "directness_lcc" in calcmetrics:
             if len(cl) > 1:
-                output["directness_lcc"] = calculate_directness(LCC, numnodepairs)
+                output["directness_lcc"] = calculate_directness(LCC, numnodepairs, pool)
             else:
                 output["directness_lcc"] = output["directness"]
 
@@ -1134,86 +2467,100 @@ def intersect_igraphs(G1, G2):
     # Ginter = G1.__and__(G2) # This does not work with attributes.
     if G1.ecount() > G2.ecount(): # Iterate through edges of the smaller graph
         G1, G2 = G2, G1
-    inter_nodes = set()
-    inter_edges = []
-    inter_edge_attributes = {}
-    inter_node_attributes = {}
     edge_attribute_name_list = G2.edge_attributes()
     node_attribute_name_list = G2.vertex_attributes()
-    for edge_attribute_name in edge_attribute_name_list:
-        inter_edge_attributes[edge_attribute_name] = []
-    for node_attribute_name in node_attribute_name_list:
-        inter_node_attributes[node_attribute_name] = []
-    for e in list(G1.es):
-        n1_id = e.source_vertex["id"]
-        n2_id = e.target_vertex["id"]
-        try:
-            n1_index = G2.vs.find(id = n1_id).index
-            n2_index = G2.vs.find(id = n2_id).index
-        except ValueError:
-            continue
-        if G2.are_connected(n1_index, n2_index):
-            inter_edges.append((n1_index, n2_index))
-            inter_nodes.add(n1_index)
-            inter_nodes.add(n2_index)
-            edge_attributes = e.attributes()
-            for edge_attribute_name in edge_attribute_name_list:
-                inter_edge_attributes[edge_attribute_name].append(edge_attributes[edge_attribute_name])
+    inter_edge_indices = np.flatnonzero(overlapping_edges(G1, G2))
+
+    # Map the end nodes of the intersecting edges of G1 to their indices in G2
+    ids2 = node_ids(G2)
+    ids2_order = np.argsort(ids2)
+    inter_edge_ids = node_ids(G1)[np.array(G1.get_edgelist(), dtype = np.int64).reshape(-1, 2)[inter_edge_indices]]
+    inter_edges = ids2_order[np.searchsorted(ids2, inter_edge_ids, sorter = ids2_order)]
+    # The set has the same iteration order as when adding the nodes edge by edge
+    inter_nodes = list(set(inter_edges.ravel().tolist()))
 
     # map nodeids to first len(inter_nodes) integers
-    idmap = {n_index:i for n_index,i in zip(inter_nodes, range(len(inter_nodes)))}
+    idmap = np.zeros(G2.vcount(), dtype = np.int64)
+    idmap[inter_nodes] = np.arange(len(inter_nodes))
 
     G_inter = ig.Graph()
     G_inter.add_vertices(len(inter_nodes))
-    G_inter.add_edges([(idmap[e[0]], idmap[e[1]]) for e in inter_edges])
+    G_inter.add_edges(idmap[inter_edges].tolist())
+    inter_es = G1.es.select(inter_edge_indices.tolist())
     for edge_attribute_name in edge_attribute_name_list:
-        G_inter.es[edge_attribute_name] = inter_edge_attributes[edge_attribute_name]
-
-    for n_index in idmap.keys():
-        v = G2.vs[n_index]
-        node_attributes = v.attributes()
-        for node_attribute_name in node_attribute_name_list:
-            inter_node_attributes[node_attribute_name].append(node_attributes[node_attribute_name])
+        G_inter.es[edge_attribute_name] = inter_es[edge_attribute_name] if len(inter_es) else []
+    inter_vs = G2.vs.select(inter_nodes)
     for node_attribute_name in node_attribute_name_list:
-        G_inter.vs[node_attribute_name] = inter_node_attributes[node_attribute_name]
+        G_inter.vs[node_attribute_name] = inter_vs[node_attribute_name] if len(inter_vs) else []
 
     return G_inter
 
 
-def calculate_metrics_additively(Gs, GT_abstracts, prune_quantiles, G_big, nnids, buffer_walk = 500, numnodepairs = 500, verbose = False, return_cov = True, Gexisting = {}, output = {
-            "length":[],
-            "length_lcc":[],
-            "coverage": [],
-            "directness": [],
-            "directness_lcc": [],
-            "poi_coverage": [],
-            "components": [],
-            "overlap_biketrack": [],
-            "overlap_bikeable": [],
-            "efficiency_global": [],
-            "efficiency_local": [],
-            "efficiency_global_routed": [],
-            "efficiency_local_routed": [],
-            "directness_lcc_linkwise": [],
-            "directness_all_linkwise": []        
-            }):
+def calculate_metrics_additively(Gs, GT_abstracts, prune_quantiles, G_big, nnids, buffer_walk = 500, numnodepairs = 500, verbose = False, return_cov = True, Gexisting = {}, output = None, pool = None):
     """Calculates all metrics, additively. 
     Coverage differences are calculated in every step instead of the whole coverage.
+    Shortest paths for directness and global efficiency are routed on the SharedCSRPool pool, see distance_rows.
+    If output (a dict of metric:list) is not given, all metrics are calculated.
     """
 
+    return calculate_metrics_growth(zip(prune_quantiles, Gs, GT_abstracts), G_big, nnids, buffer_walk, numnodepairs, verbose, return_cov, Gexisting, output, pool)
+
+
+def empty_coverage(G_big, buffer_walk = 500, coverage = "vector", coverage_resolution = 10, coverage_radii = [250, 500, 750, 1000], coverage_radii_resolution = 20):
+    """The empty coverage of a city to start from with calculate_coverage_edges: a Polygon with coverage "vector",
+    a CoverageRaster of coverage_resolution meters with "raster", and a CoverageRadii for coverage_radii of 
+    coverage_radii_resolution meters with "radii". The radii grid is coarser, as every growth stage needs a 
+    distance transform of the whole window of its new edges.
+    """
+    if coverage == "raster":
+        return CoverageRaster(G_big, buffer_walk, coverage_resolution)
+    if coverage == "radii":
+        return CoverageRadii(G_big, buffer_walk, coverage_radii_resolution, coverage_radii)
+    return Polygon()
+
+
+def calculate_metrics_growth(stages, G_big, nnids, buffer_walk = 500, numnodepairs = 500, verbose = False, return_cov = True, Gexisting = {}, output = None, pool = None, checkpoint = None, checkpointheader = {}, coverage = "vector", coverage_resolution = 10, coverage_radii = [250, 500, 750, 1000], coverage_radii_resolution = 20):
+    """Calculates all metrics additively, as calculate_metrics_additively, but for an iterable
+    of growth stages (prune_quantile, GT, GT_abstract), for example from greedy_triangulation_growth
+    or load_result. Only the current and the previous stage are held in memory.
+    If output (a dict of metric:list) is not given, all metrics are calculated.
+    If a checkpoint filename is given, the metrics of every stage are appended to it, and the stages
+    done by an interrupted run with the same checkpointheader are taken from it instead of calculated again.
+    With coverage "raster", the coverage is burnt into a CoverageRaster of coverage_resolution meters
+    instead of merging polygons, and its error bound is added as coverage_error. With coverage "radii",
+    a CoverageRadii of coverage_radii_resolution meters also gives coverage_<radius> and poi_coverage_<radius> 
+    for all coverage_radii, see empty_coverage.
+    """
+
+    if output is None:
+        output = {key: [] for key in ["length", "length_lcc", "coverage", "directness", "directness_lcc", "poi_coverage", "components", "overlap_biketrack", "overlap_bikeable", "efficiency_global", "efficiency_local", "efficiency_global_routed", "efficiency_local_routed", "directness_lcc_linkwise", "directness_all_linkwise"]}
+    cov_prev = empty_coverage(G_big, buffer_walk, coverage, coverage_resolution, coverage_radii, coverage_radii_resolution)
+    if coverage != "vector" and "coverage" in output:
+        for key in ["coverage_error"] + [metric + "_" + str(radius) for radius in getattr(cov_prev, "radii", []) for metric in ["coverage", "poi_coverage"]]:
+            if key not in output: output[key] = []
+    records = []
+    if checkpoint:
+        header = dict(checkpointheader)
+        header.update({"metrics": list(output.keys()), "buffer_walk": buffer_walk, "numnodepairs": numnodepairs, "return_cov": return_cov, "coverage": coverage, "coverage_resolution": coverage_resolution, "coverage_radii": coverage_radii, "coverage_radii_resolution": coverage_radii_resolution})
+        f, records = open_checkpoint(checkpoint, header)
+
     # BICYCLE NETWORKS
     covs = {} # covers using buffer_walk
-    cov_prev = Polygon()
     GT_prev = ig.Graph()
-    for GT, GT_abstract, prune_quantile in zip(Gs, GT_abstracts, tqdm(prune_quantiles, desc = "Bicycle networks", leave = False)):
-        if verbose: print("Calculating bike network metrics for quantile " + str(prune_quantile))
-        metrics, cov = calculate_metrics(GT, GT_abstract, G_big, nnids, output, buffer_walk, numnodepairs, verbose, return_cov, GT_prev, cov_prev, False, Gexisting)
+    for i, (prune_quantile, GT, GT_abstract) in enumerate(tqdm(stages, desc = "Bicycle networks", leave = False)):
+        if i < len(records): # done by an interrupted run
+            metrics, cov = records[i][1][1:]
+        else:
+            if verbose: print("Calculating bike network metrics for quantile " + str(prune_quantile))
+            metrics, cov = calculate_metrics(GT, GT_abstract, G_big, nnids, output, buffer_walk, numnodepairs, verbose, return_cov, GT_prev, cov_prev, False, Gexisting, pool)
+            if checkpoint: append_checkpoint(f, (prune_quantile, metrics, cov))
         
         for key in output.keys():
             output[key].append(metrics[key])
         covs[prune_quantile] = cov
         cov_prev = copy.deepcopy(cov)
         GT_prev = copy.deepcopy(GT)
+    if checkpoint: f.close()
 
 
     # # CAR CONSTRICTED BICYCLE NETWORKS (takes too long - commented out for now)
@@ -1300,6 +2647,16 @@ def generate_video(placeid, imgname, vformat = "webm", duplicatelastframe = 5, v
 
 
 
+def result_filename(placeid, poi_source, prune_measure, suffix):
+    """Path of a result file, see write_result
+    """
+    if poi_source:
+        filename = placeid + '_poi_' + poi_source + "_" + prune_measure + suffix
+    else:
+        filename = placeid + "_" + prune_measure + suffix
+    return PATH["results"] + placeid + "/" + filename
+
+
 def write_result(res, mode, placeid, poi_source, prune_measure, suffix, dictnested = {}):
     """Write results (pickle or dict to csv)
     """
@@ -1308,12 +2665,9 @@ def write_result(res, mode, placeid, poi_source, prune_measure, suffix, dictnest
     else:
         openmode = "w"
 
-    if poi_source:
-        filename = placeid + '_poi_' + poi_source + "_" + prune_measure + suffix
-    else:
-        filename = placeid + "_" + prune_measure + suffix
-
-    with open(PATH["results"] + placeid + "/" + filename, openmode) as f:
+    # Write to a temporary file first, so that an interrupted run never leaves a partial result
+    filename = result_filename(placeid, poi_source, prune_measure, suffix)
+    with open(filename + ".tmp", openmode) as f:
         if mode == "pickle":
             pickle.dump(res, f)
         elif mode == "dict":
@@ -1332,6 +2686,146 @@ def write_result(res, mode, placeid, poi_source, prune_measure, suffix, dictnest
                 row = {'network': key}
                 row.update(val)
                 w.writerow(row)
+    os.replace(filename + ".tmp", filename)
+
+
+def open_checkpoint(filename, header):
+    """Open the checkpoint file filename for appending records with append_checkpoint.
+    If it exists and was started with the same header (a dict of the settings it depends on),
+    it is resumed, otherwise it is started anew. A record that was cut off by an interrupted
+    run is removed. Returns the open file and the list of (offset, record) of the complete records.
+    """
+    records = []
+    end = 0
+    if os.path.isfile(filename):
+        f = open(filename, "r+b")
+        try:
+            if pickle.load(f) == header:
+                end = f.tell()
+                while True:
+                    record = pickle.load(f)
+                    records.append((end, record))
+                    end = f.tell()
+        except Exception: # end of file, or a record that was cut off
+            pass
+        f.seek(end)
+        f.truncate()
+    else:
+        f = open(filename, "wb")
+    if end == 0:
+        records = []
+        append_checkpoint(f, header)
+    return (f, records)
+
+
+def append_checkpoint(f, record):
+    """Append record to the checkpoint file f (see open_checkpoint) and make sure it is on disk.
+    Returns the offset of the record.
+    """
+    offset = f.tell()
+    pickle.dump(record, f)
+    f.flush()
+    os.fsync(f.fileno())
+    return offset
+
+
+class ResultStream:
+    """Result pickle that is written one growth stage (prune_quantile, GT, GT_abstract) at a time,
+    so that the GTs of all quantiles never have to be held in memory together. Read it with load_result.
+    
+    The file consists of pickled records: a format marker (with header), one record per stage, and
+    the results dict (with the offsets of the stages), followed by the offset of the results
+    dict as 8 byte integer. It is written to filename.stream.tmp (not filename.tmp, which write_result 
+    uses) and only replaces filename on close. filename.stream.tmp is a checkpoint: If a run with 
+    the same header was interrupted, its stages are kept and quantiles gives the prune quantiles that are done. Each stage record also holds the
+    paths that were newly routed for it (as from paths_to_ids), so that paths gives all routed 
+    paths of the stages done, without routing them again.
+    """
+    
+    def __init__(self, filename, header = {}):
+        self.filename = filename
+        self.tmpfilename = filename + ".stream.tmp"
+        header = dict(header)
+        header["format"] = "stream"
+        self.f, records = open_checkpoint(self.tmpfilename, header)
+        self.offsets = [(record[0], offset) for offset, record in records]
+        
+    def quantiles(self):
+        """Prune quantiles of the stages written so far
+        """
+        return [prune_quantile for prune_quantile, offset in self.offsets]
+        
+    def stages(self, start = 0):
+        """Generator of the stages written so far, from the stage with index start on
+        """
+        return result_stages(self.tmpfilename, self.offsets[start:])
+        
+    def paths(self):
+        """All routed paths of the stages written so far, see write
+        """
+        paths = {}
+        for record in result_stages(self.tmpfilename, self.offsets, True):
+            paths.update(record[3])
+        return paths
+        
+    def write(self, prune_quantile, GT, GT_abstract, paths = {}):
+        """Appends a stage, with paths, the newly routed paths (node ids) of the stage
+        """
+        self.offsets.append((prune_quantile, append_checkpoint(self.f, (prune_quantile, GT, GT_abstract, paths))))
+        
+    def close(self, res):
+        """Writes the results dict res (everything but the GTs, for example the MST) and finishes the file.
+        """
+        res = dict(res)
+        res["stage_offsets"] = self.offsets
+        offset = self.f.tell()
+        pickle.dump(res, self.f)
+        self.f.write(offset.to_bytes(8, "little"))
+        self.f.close()
+        os.replace(self.tmpfilename, self.filename)
+        
+    def remove(self):
+        """Discards the file, for example after the stages were written in another format
+        """
+        self.f.close()
+        os.remove(self.tmpfilename)
+
+
+def result_stages(filename, offsets, records = False):
+    """Generator of the growth stages (prune_quantile, GT, GT_abstract) at offsets of a streamed result file,
+    or with records, of the whole stage records (including their paths, see ResultStream)
+    """
+    with open(filename, 'rb') as f:
+        for prune_quantile, offset in offsets:
+            f.seek(offset)
+            record = pickle.load(f)
+            yield record if records else record[:3]
+
+
+def load_result(filename, stream = False):
+    """Load a result pickle, written either by write_result or by ResultStream.
+    Returns the results dict with the lists GTs and GT_abstracts. With stream, returns the
+    results dict without them, and a generator of the growth stages (prune_quantile, GT, GT_abstract)
+    that reads only one stage at a time from a streamed file.
+    """
+    with open(filename, 'rb') as f:
+        res = pickle.load(f)
+        if res.get("format") == "stream":
+            f.seek(-8, os.SEEK_END)
+            f.seek(int.from_bytes(f.read(8), "little"))
+            res = pickle.load(f)
+            stages = result_stages(filename, res.pop("stage_offsets"))
+        else:
+            stages = zip(res["prune_quantiles"], res.pop("GTs"), res.pop("GT_abstracts"))
+    
+    if stream:
+        return (res, stages)
+    res["GTs"] = []
+    res["GT_abstracts"] = []
+    for prune_quantile, GT, GT_abstract in stages:
+        res["GTs"].append(GT)
+        res["GT_abstracts"].append(GT_abstract)
+    return res
 
 
 def gdf_to_geojson(gdf, properties):
@@ -6,19 +6,28 @@ import os
 import watermark
 import pickle
 import itertools
+import heapq
 import random
 import zipfile
+import zlib
 from collections import defaultdict
 import pprint
 pp = pprint.PrettyPrinter(indent=4)
 from tqdm.notebook import tqdm
 import warnings
 import shutil
+import hashlib
+import multiprocessing
+from multiprocessing import shared_memory, resource_tracker
 
 # Math/Data
 import math
 import numpy as np
 import pandas as pd
+import scipy.sparse
+from scipy.sparse import csgraph
+import scipy.spatial
+import scipy.ndimage
 
 # Network
 import igraph as ig
@@ -41,6 +50,8 @@ import shapely
 from osgeo import gdal, osr
 from haversine import haversine, haversine_vector
 import pyproj
+import rasterio.features
+import rasterio.transform
 from shapely.geometry import Point, MultiPoint, LineString, Polygon, MultiLineString, MultiPolygon
 import shapely.ops as ops
 import geopandas as gpd
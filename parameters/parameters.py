@@ -24,8 +24,19 @@ poiparameters = {"railwaystation":{'railway':['station','halt']}#, # should mayb
                  #"busstop":{'highway':'bus_stop'}
                 }
 
+# 03
+routing = "igraph" # igraph, alt, csr, csrpool, simplified: How to route on the street network, see load_router
+gt_candidates = "all" # all, delaunay, knn: Which poi pairs the GT considers. delaunay and knn are faster but approximate (the MST stays exact), see candidate_poipairs
+gt_verify = False # Whether to compare an approximate GT with the exact GT, see fast_gt_report
+stream_results = False # Whether to write the GTs one growth stage at a time (bounding memory for large cities), see ResultStream. Such results must be read with load_result, as the scripts and notebooks 04-09 do (10 reads the exports of 07), not with pickle.load
+random_seeds = 1 # Number of random prune orders (seeds 0, 1, ...) for prune_measure random. With more than 1, an ensemble is generated, see greedy_triangulation_routing_ensemble
+
 # 04
 buffer_walk = 500 # Buffer in m for coverage calculations. (How far people are willing to walk)
+coverage_mode = "vector" # vector, raster, radii: How to calculate the coverage of the growth stages, see CoverageRaster and CoverageRadii
+coverage_resolution = 10 # in m, pixel size for the raster coverage
+coverage_radii = [250, 500, 750, 1000] # in m, walking distances for which the radii coverage mode also calculates coverage and poi_coverage
+coverage_radii_resolution = 20 # in m, pixel size for the radii coverage, coarser than coverage_resolution since it needs a distance transform per growth stage
 numnodepairs = 500 # Number of node pairs to consider for random sample to calculate directness (O(numnodepairs^2), so better not go over 1000)
 
 #05
@@ -8,10 +8,66 @@ for placeid, placeinfo in cities.items():
     with open(PATH["data"] + placeid + "/" + placeid + '_poi_' + poi_source + '_nnidscarall.csv') as f:
         nnids = [int(line.rstrip()) for line in f]
     
+    # Load the router (by default igraph on G_carall itself)
+    router = load_router(PATH["data"] + placeid + "/", placeid, G_carall, routing, pois = nnids)
+    
+    # Load POI distances (calculated once per poi_source, shared by all prune measures)
+    # With candidate pairs, only these are routed for the GT
+    if gt_candidates == "all" or gt_verify:
+        poidistances = load_poi_distances(PATH["data"] + placeid + "/", placeid, poi_source, G_carall, nnids, router = router)
+    else:
+        poidistances = None
+    
     # Generation
-    (GTs, GT_abstracts) = greedy_triangulation_routing(G_carall, nnids, prune_quantiles, prune_measure)
-    (MST, MST_abstract) = mst_routing(G_carall, nnids)
+    # Every growth stage is checkpointed, so an interrupted run resumes at the first missing quantile
+    # It is only resumed if the network and the pois are unchanged (checked via a hash of their files)
+    filehash = hash_files(network_files(PATH["data"] + placeid + "/", placeid, "carall") + [PATH["data"] + placeid + "/" + placeid + '_poi_' + poi_source + '_nnidscarall.csv'])
+    resultstream = ResultStream(result_filename(placeid, poi_source, prune_measure, ".pickle"), {"prune_measure": prune_measure, "prune_quantiles": prune_quantiles, "pois": nnids, "filehash": filehash, "routing": routing, "gt_candidates": gt_candidates, "random_seeds": random_seeds})
+    quantiles_done = resultstream.quantiles()
+    quantiles_missing = prune_quantiles[len(quantiles_done):]
+    pathcache = {}
+    if quantiles_done:
+        print(placeid + ": Resuming at quantile " + str(len(quantiles_done) + 1) + " of " + str(len(prune_quantiles)))
+        # The routed paths of the stages done before, stored with them
+        pathcache = paths_from_ids(G_carall, resultstream.paths(), reverse = False)
+    npaths = len(pathcache)
+    if not quantiles_missing:
+        stages = []
+    elif prune_measure == "random" and random_seeds > 1:
+        # The ensemble shares the triangulation and routing, seed 0 are the regular results
+        # The other seeds are stored as edge orders with the routed paths, their GTs are rebuilt in 04
+        ensemble = greedy_triangulation_routing_ensemble(G_carall, nnids, range(random_seeds), poidistances, router, gt_candidates, pathcache)
+        # pois and filehash let 04 check that the ensemble belongs to the results
+        write_result({"placeid": placeid, "poi_source": poi_source, "prune_quantiles": prune_quantiles, "pois": nnids, "filehash": filehash, "GT_full": ensemble["GT_full"], "edgeorders": ensemble["edgeorders"], "paths": paths_to_ids(G_carall, pathcache)}, "pickle", placeid, poi_source, prune_measure, "_ensemble.pickle")
+        stages = ensemble_growth(G_carall, ensemble, 0, quantiles_missing, pathcache)
+    else:
+        stages = greedy_triangulation_growth(G_carall, nnids, quantiles_missing, prune_measure, poidistances, router, gt_candidates, pathcache)
+    if not (prune_measure == "random" and random_seeds > 1) and os.path.isfile(result_filename(placeid, poi_source, prune_measure, "_ensemble.pickle")):
+        os.remove(result_filename(placeid, poi_source, prune_measure, "_ensemble.pickle")) # from an earlier run, 04 would aggregate it
+    for stage in stages:
+        # Store the paths routed for this stage (or before it, by the ensemble) with it
+        resultstream.write(*stage, paths_to_ids(G_carall, pathcache, list(itertools.islice(pathcache, npaths, None))))
+        npaths = len(pathcache)
+    # The MST is exact also with candidate pairs, so it needs the distances of all poi pairs
+    if poidistances is None:
+        poidistances = load_poi_distances(PATH["data"] + placeid + "/", placeid, poi_source, G_carall, nnids, router = router)
+    (MST, MST_abstract) = mst_routing(G_carall, nnids, poidistances, router)
+    if isinstance(router, SharedCSRPool): router.close()
     
     # Write results
-    results = {"placeid": placeid, "prune_measure": prune_measure, "poi_source": poi_source, "prune_quantiles": prune_quantiles, "GTs": GTs, "GT_abstracts": GT_abstracts, "MST": MST, "MST_abstract": MST_abstract}
-    write_result(results, "pickle", placeid, poi_source, prune_measure, ".pickle")
+    # pois and the routed paths allow to update the results for changed pois, see update_greedy_triangulation
+    results = {"placeid": placeid, "prune_measure": prune_measure, "poi_source": poi_source, "prune_quantiles": prune_quantiles, "MST": MST, "MST_abstract": MST_abstract, 
+               "pois": nnids, "paths": paths_to_ids(G_carall, pathcache)}
+    if gt_candidates != "all" and gt_verify:
+        results["gt_report"] = fast_gt_report(G_carall, nnids, gt_candidates, poidistances)
+        print(placeid + ": GT with " + gt_candidates + " candidates: " + str(results["gt_report"]))
+    if stream_results:
+        resultstream.close(results)
+    else:
+        results["GTs"] = []
+        results["GT_abstracts"] = []
+        for prune_quantile, GT, GT_abstract in resultstream.stages():
+            results["GTs"].append(GT)
+            results["GT_abstracts"].append(GT_abstract)
+        write_result(results, "pickle", placeid, poi_source, prune_measure, ".pickle")
+        resultstream.remove()
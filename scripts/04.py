@@ -1,5 +1,7 @@
 warnings.filterwarnings('ignore')
 rerun_existing = True
+# Process pool for shortest paths on large networks on the cluster, started once and shared by all graphs, see distance_rows
+pool = SharedCSRPool(processes = available_cpus() if os.environ.get("SLURM_CPUS_PER_TASK") else 1)
 
 for placeid, placeinfo in cities.items():
     print(placeid + ": Analyzing existing infrastructure.")
@@ -51,7 +53,7 @@ for placeid, placeinfo in cities.items():
         covs = {}
         for networktype in tqdm(networktypes, desc = "Networks", leave = False):
             if debug: print(placeid + ": Analyzing results: " + networktype)
-            metrics, cov = calculate_metrics(Gs[networktype], Gs[networktype + "_simplified"], Gs['carall'], nnids, empty_metrics, buffer_walk, numnodepairs, debug)
+            metrics, cov = calculate_metrics(Gs[networktype], Gs[networktype + "_simplified"], Gs['carall'], nnids, empty_metrics, buffer_walk, numnodepairs, debug, pool = pool)
             for key, val in metrics.items():
                 output_place[networktype][key] = val
             covs[networktype] = cov
@@ -79,15 +81,19 @@ for placeid, placeinfo in cities.items():
             
     # Load results
     filename = placeid + '_poi_' + poi_source + "_" + prune_measure
-    resultfile = open(PATH["results"] + placeid + "/" + filename + ".pickle",'rb')
-    res = pickle.load(resultfile)
-    resultfile.close()
+    # The GTs are read one growth stage at a time
+    resultfile = PATH["results"] + placeid + "/" + filename + ".pickle"
+    res, stages = load_result(resultfile, stream = True)
     if debug: pp.pprint(res)
          
     # Calculate
     # output contains lists for all the prune_quantile values of the corresponding results
-    output, covs = calculate_metrics_additively(res["GTs"], res["GT_abstracts"], res["prune_quantiles"], G_carall, nnids, buffer_walk, numnodepairs, debug, True, Gexisting)
-    output_MST, cov_MST = calculate_metrics(res["MST"], res["MST_abstract"], G_carall, nnids, output, buffer_walk, numnodepairs, debug, True, ig.Graph(), Polygon(), False, Gexisting)
+    # Every quantile is checkpointed, so an interrupted run resumes at the first missing quantile
+    checkpoint = result_filename(placeid, poi_source, prune_measure, "_checkpoint.pickle")
+    output, covs = calculate_metrics_growth(stages, G_carall, nnids, buffer_walk, numnodepairs, debug, True, Gexisting, pool = pool, checkpoint = checkpoint, checkpointheader = {"result": hash_files([resultfile])}, coverage = coverage_mode, coverage_resolution = coverage_resolution, coverage_radii = coverage_radii, coverage_radii_resolution = coverage_radii_resolution)
+    # The MST gets a cover of the same coverage_mode, so that it has the same metrics (coverage_error, coverage_<radius>, ...)
+    cov_MST = empty_coverage(G_carall, buffer_walk, coverage_mode, coverage_resolution, coverage_radii, coverage_radii_resolution)
+    output_MST, cov_MST = calculate_metrics(res["MST"], res["MST_abstract"], G_carall, nnids, output, buffer_walk, numnodepairs, debug, True, ig.Graph(), cov_MST, False, Gexisting, pool)
         
     # Save the covers
     write_result(covs, "pickle", placeid, poi_source, prune_measure, "_covers.pickle")
@@ -99,3 +105,26 @@ for placeid, placeinfo in cities.items():
 #     write_result(output_carminusbike, "dict", placeid, poi_source, prune_measure, "_carminusbike.csv")
 #     write_result(output_carconstrictedbike, "dict", placeid, poi_source, prune_measure, "_carconstrictedbike.csv")
     write_result(output_MST, "dict", placeid, poi_source, "", "mst.csv")
+    os.remove(checkpoint)
+    
+    # Random ensemble: mean and confidence band of the metrics over all seeds
+    ensemblefile = PATH["results"] + placeid + "/" + filename + "_ensemble.pickle"
+    if prune_measure == "random" and os.path.isfile(ensemblefile):
+        with open(ensemblefile, 'rb') as f:
+            ensemble = pickle.load(f)
+        # The ensemble must come from the same network, pois and prune quantiles as the results (seed 0)
+        filehash = hash_files(network_files(PATH["data"] + placeid + "/", placeid, "carall") + [PATH["data"] + placeid + "/" + placeid + '_poi_' + poi_source + '_nnidscarall.csv'])
+        if ensemble.get("filehash") != filehash or ensemble.get("pois") != res.get("pois") or ensemble["prune_quantiles"] != res["prune_quantiles"]:
+            print(placeid + ": Skipping the random ensemble, it does not belong to the results")
+            continue
+        # The GTs of each seed are rebuilt one growth stage at a time from its edge order and the routed paths
+        pathcache = paths_from_ids(G_carall, ensemble["paths"])
+        outputs = [output]
+        for seed in ensemble["edgeorders"]:
+            if seed == 0: continue # Same as res
+            stages = ensemble_growth(G_carall, ensemble, seed, ensemble["prune_quantiles"], pathcache)
+            output_seed, _ = calculate_metrics_growth(stages, G_carall, nnids, buffer_walk, numnodepairs, debug, True, Gexisting, {key: [] for key in output}, pool, coverage = coverage_mode, coverage_resolution = coverage_resolution, coverage_radii = coverage_radii, coverage_radii_resolution = coverage_radii_resolution)
+            outputs.append(output_seed)
+        write_result(aggregate_ensemble(outputs), "dict", placeid, poi_source, prune_measure, "_ensemble.csv")
+
+pool.close()
@@ -89,8 +89,7 @@ for placeid, placeinfo in cities.items():
     # GENERATED, POI BASED
     # Load results
     filename = placeid + '_poi_' + poi_source + "_" + prune_measure + ".pickle"
-    with open(PATH["results"] + placeid + "/" + filename, 'rb') as f:
-        res = pickle.load(f)
+    res, stages = load_result(PATH["results"] + placeid + "/" + filename, stream = True)
     if debug: pp.pprint(res)
         
     # PLOT abstract MST
@@ -124,8 +123,9 @@ for placeid, placeinfo in cities.items():
     plt.savefig(PATH["plots_networks"] + placeid + "/" + placeid + '_MSTabstractall_poi_' + poi_source + '.png', bbox_inches="tight", dpi=plotparam["dpi"])
     plt.close()
     
-    # PLOT abstract greedy triangulation (this can take some minutes)
-    for GT_abstract, prune_quantile in zip(res["GT_abstracts"], res["prune_quantiles"]):
+    # The growth stages are read and plotted one at a time (this can take some minutes)
+    for prune_quantile, GT, GT_abstract in stages:
+        # PLOT abstract greedy triangulation
         fig = initplot()
         nxdraw(G_carall, "carall")
         try:
@@ -138,8 +138,7 @@ for placeid, placeinfo in cities.items():
         plt.savefig(PATH["plots_networks"] + placeid + "/" + placeid + '_GTabstract_poi_' + poi_source + "_" + prune_measures[prune_measure] + "{:.3f}".format(prune_quantile) + '.png', bbox_inches="tight", dpi=plotparam["dpi"])
         plt.close()
     
-    # PLOT all together (this can take some minutes)
-    for GT, prune_quantile in zip(res["GTs"], res["prune_quantiles"]):
+        # PLOT all together
         fig = initplot()
         nxdraw(G_carall, "carall")
         nxdraw(GT, "bikegrown", map_center, nodesize = nodesize_grown)
@@ -169,8 +168,7 @@ for placeid, placeinfo in cities.items():
     
     # Load results
     filename = placeid + '_poi_' + poi_source + "_" + prune_measure + ".pickle"
-    with open(PATH["results"] + placeid + "/" + filename, 'rb') as f:
-        res = pickle.load(f)
+    res, stages = load_result(PATH["results"] + placeid + "/" + filename, stream = True)
     
     # Load covers
     filename = placeid + '_poi_' + poi_source + "_" + prune_measure + "_covers"
@@ -182,11 +180,12 @@ for placeid, placeinfo in cities.items():
     
     # Construct and plot patches from covers
     patchlist_car, patchlist_car_holes = cov_to_patchlist(cov_car, map_center)
-    for GT, prune_quantile, cov in zip(res["GTs"], res["prune_quantiles"], covs.values()):
+    for (prune_quantile, GT, GT_abstract), cov in zip(stages, covs.values()):
         fig = initplot()
         
         # Covers
         axes = fig.add_axes([0, 0, 1, 1]) # left, bottom, width, height (range 0 to 1)
+        if isinstance(cov, CoverageRaster): cov = cov.polygon()
         patchlist_bike, patchlist_bike_holes = cov_to_patchlist(cov, map_center)
         
         # We have this contrived order due to alphas, holes, and matplotlib's inability to draw polygon patches with holes. This only works because the car network is a superset of the bike network.
@@ -15,9 +15,7 @@ for placeid, placeinfo in cities.items():
 
     # Load results
     filename = placeid + '_poi_' + poi_source + "_" + prune_measure
-    resultfile = open(PATH["results"] + placeid + "/" + filename + ".pickle",'rb')
-    res = pickle.load(resultfile)
-    resultfile.close()
+    res = load_result(PATH["results"] + placeid + "/" + filename + ".pickle")
 
     # Calculate
     # output contains lists for all the prune_quantile values of the corresponding results
@@ -10,9 +10,7 @@ for placeid, placeinfo in cities.items():
             
     # Load results
     filename = placeid + '_poi_' + poi_source + "_" + prune_measure
-    resultfile = open(PATH["results"] + placeid + "/" + filename + ".pickle",'rb')
-    res = pickle.load(resultfile)
-    resultfile.close()
+    res = load_result(PATH["results"] + placeid + "/" + filename + ".pickle")
     
     if debug:
         fig = initplot()
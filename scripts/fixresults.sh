@@ -1,6 +1,7 @@
 #!/bin/bash
 # This script takes from all poi+metric results csv files the header and the last 40 rows,
 # fixing the problem of appended results when SLURM jobs of same cities were repeated
+# (Results written since the per-quantile checkpoints of 03 and 04 do not have this problem)
 
 # https://stackoverflow.com/questions/9612090/how-to-loop-through-file-names-returned-by-find
 #shopt -s globstar